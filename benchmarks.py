@@ -0,0 +1,252 @@
+import argparse
+import datetime
+import itertools
+import json
+import pathlib
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import timeit
+import tracemalloc
+import typing
+
+import numpy as np
+
+from framework.game import *
+from framework.utils import *
+from framework.plotting import *
+from framework.persistence import *
+from independent_decentralized_learning import *
+from routing_game import *
+from experiment_runner import *
+from utils import *
+
+
+BENCHMARK_FORMAT = 1
+
+
+def routing_parameters(N: int, M: int, U: int):
+    # the routing game of the figures, with costs and benefits extended to M routes
+    return dict(N=N, M=M, U=U, m=[2 + 2 * route for route in range(M)], b=[9 + 7 * route for route in range(M)],
+                common_interest=True)
+
+
+def uniform_joint_policy(game: StochasticGame):
+    return JointPolicy({i: Policy(game.S, game.A[i], lambda s, a_i, i=i: 1 / len(game.A[i])) for i in game.I})
+
+
+def learned_history(N: int, M: int, U: int, K: int, trials: int):
+    game = create_compiled_routing_game(**routing_parameters(N, M, U))
+    history = batched_independent_decentralized_algo(game, K, seeds=[j + 1 for j in range(trials)],
+                                                     schedule=checkpoint_schedule(K))
+    return game, history
+
+
+# each benchmark prepares its inputs from a case (untimed) and returns the function to time, with the number of
+# steps it takes if its throughput is of interest
+def bench_create_routing_game(N, M, U, K, trials):
+    return (lambda: create_routing_game(**routing_parameters(N, M, U))), None
+
+
+def bench_create_compiled_routing_game(N, M, U, K, trials):
+    return (lambda: create_compiled_routing_game(**routing_parameters(N, M, U))), None
+
+
+def bench_load_compiled_game(N, M, U, K, trials):
+    # opening a saved game should cost far less than bench_create_compiled_routing_game at any size
+    game = create_compiled_routing_game(**routing_parameters(N, M, U))
+    game.transition_sampler()
+    directory = tempfile.TemporaryDirectory()  # removed once the benchmark is dropped
+    path = save_compiled_game(game, pathlib.Path(directory.name) / "game")
+    return (lambda directory=directory: load_compiled_game(path)), None
+
+
+def bench_independent_decentralized_algo(N, M, U, K, trials):
+    game = create_routing_game(**routing_parameters(N, M, U))
+
+    def run():
+        random.seed(1)
+        return independent_decentralized_algo(game, K)
+    return run, K
+
+
+def bench_batched_independent_decentralized_algo(N, M, U, K, trials):
+    game = create_compiled_routing_game(**routing_parameters(N, M, U))
+    return (lambda: batched_independent_decentralized_algo(game, K, seeds=[j + 1 for j in range(trials)])), K * trials
+
+
+def bench_value_iteration(N, M, U, K, trials):
+    game = create_routing_game(**routing_parameters(N, M, U))
+    i = next(iter(game.I))
+    pi_minus_i = uniform_joint_policy(game).minus(i)
+    return (lambda: value_iteration(i, pi_minus_i, game.P, game.R, list(game.S), game.A, game.delta,
+                                    tol=BEST_RESPONSE_TOL, record_history=False)), None
+
+
+def bench_construct_P_pi(N, M, U, K, trials):
+    game = create_routing_game(**routing_parameters(N, M, U))
+    i = next(iter(game.I))
+    pi = uniform_joint_policy(game)
+    return (lambda: construct_P_pi(i, pi[i], pi.minus(i), game.P, list(game.S), game.A)), None
+
+
+def bench_construct_r_pi(N, M, U, K, trials):
+    game = create_routing_game(**routing_parameters(N, M, U))
+    i = next(iter(game.I))
+    pi = uniform_joint_policy(game)
+    return (lambda: construct_r_pi(i, pi[i], pi.minus(i), game.R, list(game.S), game.A)), None
+
+
+def bench_plot_policy_convergence_l1(N, M, U, K, trials):
+    (_, history) = learned_history(N, M, U, K, trials)
+    return (lambda: policy_convergence_l1(history)), None
+
+
+def bench_plot_local_Q_convergence_l1(N, M, U, K, trials):
+    (_, history) = learned_history(N, M, U, K, trials)
+    return (lambda: local_Q_convergence_l1(history)), None
+
+
+def bench_plot_policy_convergence_to_nash_l1(N, M, U, K, trials):
+    (game, history) = learned_history(N, M, U, K, trials)
+    # with the solver settings of plot_policy_convergence_to_nash_l1
+    return (lambda: policy_convergence_to_nash_l1(game, history)), None
+
+
+def bench_plot_value_iteration_convergence_l1(N, M, U, K, trials):
+    (game, history) = learned_history(N, M, U, K, trials)
+    (vi_histories, _) = policy_convergence_to_nash_l1(game, history)
+    return (lambda: value_iteration_convergence_l1(game.I, vi_histories)), None
+
+
+BENCHMARKS: typing.Dict[str, typing.Callable] = {
+    "create_routing_game": bench_create_routing_game,
+    "create_compiled_routing_game": bench_create_compiled_routing_game,
+    "load_compiled_game": bench_load_compiled_game,
+    "independent_decentralized_algo": bench_independent_decentralized_algo,
+    "batched_independent_decentralized_algo": bench_batched_independent_decentralized_algo,
+    "value_iteration": bench_value_iteration,
+    "construct_P_pi": bench_construct_P_pi,
+    "construct_r_pi": bench_construct_r_pi,
+    "plot_policy_convergence_l1": bench_plot_policy_convergence_l1,
+    "plot_local_Q_convergence_l1": bench_plot_local_Q_convergence_l1,
+    "plot_policy_convergence_to_nash_l1": bench_plot_policy_convergence_to_nash_l1,
+    "plot_value_iteration_convergence_l1": bench_plot_value_iteration_convergence_l1,
+}
+
+
+def measure(fn: typing.Callable, repeat: int):
+    # wall-clock seconds per run, averaged over enough runs to take at least 0.2 s (as timeit.Timer.autorange
+    # picks them) so that fast cases are not lost in timer noise, for each of repeat timings; then the peak of the
+    # memory allocated during one more traced run (tracing slows the run down, so it is not timed)
+    timer = timeit.Timer(fn)
+    (loops, _) = timer.autorange()
+    times = [timer.timeit(loops) / loops for _ in range(repeat)]
+    tracemalloc.start()
+    try:
+        fn()
+        (_, peak_bytes) = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return times, loops, peak_bytes
+
+
+def run_benchmarks(names: typing.List[str], cases: typing.List[typing.Dict[str, int]], repeat: int = 3):
+    results = []
+    for (name, case) in itertools.product(names, cases):
+        (fn, steps) = BENCHMARKS[name](**case)
+        (times, loops, peak_bytes) = measure(fn, repeat)
+        seconds = min(times)
+        result = dict(
+            benchmark=name, parameters=dict(case, S=2 ** case["M"]), seconds=seconds, times=times, loops=loops,
+            steps_per_second=steps / seconds if steps is not None and seconds > 0 else None, peak_bytes=peak_bytes
+        )
+        print(f"{name} {result['parameters']}: {seconds:.4g} s, peak {peak_bytes / 2 ** 20:.3g} MiB"
+              + (f", {result['steps_per_second']:.4g} steps/s" if steps is not None else ""), flush=True)
+        results.append(result)
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=pathlib.Path(__file__).parent).stdout.strip() or None
+    except OSError:
+        commit = None
+    return dict(python=sys.version.split()[0], numpy=np.__version__, platform=platform.platform(),
+                machine=platform.machine(), commit=commit)
+
+
+def save_results(results: typing.List[dict], file: pathlib.Path):
+    file = pathlib.Path(file)
+    file.parent.mkdir(parents=True, exist_ok=True)
+    with open(file, "w") as f:
+        json.dump(dict(format=BENCHMARK_FORMAT, created=datetime.datetime.now().isoformat(timespec="seconds"),
+                       environment=environment(), results=results), f, indent=2)
+
+
+def load_results(file: pathlib.Path):
+    with open(file) as f:
+        report = json.load(f)
+    assert report["format"] == BENCHMARK_FORMAT
+    return report["results"]
+
+
+def result_key(result: dict):
+    return result["benchmark"], json.dumps(result["parameters"], sort_keys=True)
+
+
+def compare(results: typing.List[dict], baseline: typing.List[dict], time_threshold: float = 0.2,
+            memory_threshold: float = 0.2):
+    # (benchmark, parameters, time ratio, memory ratio, regressed) for every result with a baseline; a result
+    # regresses if its time or peak memory exceeds the baseline's by more than the threshold fraction
+    baseline = {result_key(result): result for result in baseline}
+    rows = []
+    for result in results:
+        if result_key(result) not in baseline:
+            continue
+        reference = baseline[result_key(result)]
+        time_ratio = result["seconds"] / reference["seconds"] if reference["seconds"] > 0 else 1.0
+        memory_ratio = result["peak_bytes"] / reference["peak_bytes"] if reference["peak_bytes"] > 0 else 1.0
+        regressed = time_ratio > 1 + time_threshold or memory_ratio > 1 + memory_threshold
+        rows.append((result["benchmark"], result["parameters"], time_ratio, memory_ratio, regressed))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="time the game builders, learners, solvers and plot metrics "
+                                                 "over a grid of game sizes")
+    parser.add_argument("--benchmarks", nargs="+", choices=sorted(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--N", type=int, nargs="+", default=[2, 3, 4], help="players")
+    parser.add_argument("--M", type=int, nargs="+", default=[2], help="routes; there are 2 ** M states")
+    parser.add_argument("--U", type=int, nargs="+", default=[2], help="congestion thresholds")
+    parser.add_argument("--K", type=int, nargs="+", default=[1000], help="learning steps")
+    parser.add_argument("--trials", type=int, default=4, help="lanes of the batched learner")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="timings per benchmark, each of at least 0.2 s of runs; the fastest is kept")
+    parser.add_argument("--output", type=pathlib.Path, default=EXPERIMENTS_DIR / "benchmarks.json")
+    parser.add_argument("--results", type=pathlib.Path, default=None,
+                        help="compare these saved results instead of running the benchmarks")
+    parser.add_argument("--compare", type=pathlib.Path, default=None, help="baseline results to compare against")
+    parser.add_argument("--time-threshold", type=float, default=0.2, help="allowed fractional slowdown")
+    parser.add_argument("--memory-threshold", type=float, default=0.2, help="allowed fractional peak memory growth")
+    args = parser.parse_args()
+
+    if args.results is not None:
+        results = load_results(args.results)
+    else:
+        cases = [dict(N=N, M=M, U=U, K=K, trials=args.trials)
+                 for (N, M, U, K) in itertools.product(args.N, args.M, args.U, args.K)]
+        results = run_benchmarks(args.benchmarks, cases, repeat=args.repeat)
+        save_results(results, args.output)
+        print(f"results written to {args.output}")
+
+    if args.compare is not None:
+        rows = compare(results, load_results(args.compare), args.time_threshold, args.memory_threshold)
+        for (name, parameters, time_ratio, memory_ratio, regressed) in rows:
+            print(f"{'REGRESSION' if regressed else 'ok':>10} {name} {parameters}: "
+                  f"time x{time_ratio:.3f}, peak memory x{memory_ratio:.3f}")
+        if any(row[-1] for row in rows):
+            sys.exit(1)
@@ -0,0 +1,162 @@
+import concurrent.futures
+import os
+import random
+import typing
+import weakref
+
+import numpy as np
+
+from framework.compiled import *
+from framework.anonymous import *
+from framework.plotting import *
+from framework.recording import *
+from framework.shared import *
+from framework.cache import *
+from framework.persistence import *
+from independent_decentralized_learning import *
+from routing_game import *
+
+
+GAME_PARAMETERS = ("N", "M", "U", "m", "b", "lambda_1", "lambda_2", "delta", "common_interest", "strategy_independent")
+TRIAL_PARAMETERS = ("K", "tau", "alpha_r", "beta_r")
+CACHE_VERSION = 2  # bump when the learner or the cached formats change
+
+
+def build_game(N, M, U, m, b, lambda_1, lambda_2, delta, common_interest, strategy_independent, anonymous=False):
+    # the compiled (or, with anonymous, the occupancy-vector) routing game, tabulated directly
+    if anonymous:
+        return create_anonymous_routing_game(N=N, M=M, U=U, m=m, b=b, lambda_1=lambda_1, lambda_2=lambda_2,
+                                             delta=delta, common_interest=common_interest,
+                                             strategy_independent_transitions=strategy_independent)
+    return create_compiled_routing_game(N=N, M=M, U=U, m=m, b=b, lambda_1=lambda_1, lambda_2=lambda_2, delta=delta,
+                                        common_interest=common_interest,
+                                        strategy_independent_transitions=strategy_independent)
+
+
+def game_key(parameters: typing.Dict[str, typing.Any]):
+    # the game depends on nothing else, seeds included
+    return content_key("game", CACHE_VERSION, {name: parameters[name] for name in GAME_PARAMETERS},
+                       parameters.get("anonymous", False))
+
+
+def trial_key(parameters: typing.Dict[str, typing.Any], trial: int):
+    # the recorded checkpoints and the game representation are part of a trial's result
+    return content_key("trial", CACHE_VERSION, {name: parameters[name] for name in GAME_PARAMETERS + TRIAL_PARAMETERS},
+                       parameters.get("anonymous", False), repr(checkpoint_schedule(parameters["K"])), trial)
+
+
+def load_game(parameters: typing.Dict[str, typing.Any], cache: ResultCache = None):
+    # the compiled game of an experiment, built only if the cache does not hold it yet;
+    # cached games are saved with their transition sampler and memory-mapped on load, and their entry is pinned
+    # against eviction for as long as the game is alive
+    key = game_key(parameters)
+    path = cache.get_directory(key) if cache is not None else None
+    if path is not None:
+        compiled_game = load_compiled_game(path)
+        cache.pin(key)
+        weakref.finalize(compiled_game, cache.unpin, key)
+        return compiled_game
+    compiled_game = build_game(
+        **{name: parameters[name] for name in GAME_PARAMETERS}, anonymous=parameters.get("anonymous", False)
+    )
+    if cache is not None:
+        compiled_game.transition_sampler()
+        cache.put_directory(key, lambda path: save_compiled_game(compiled_game, path))
+    return compiled_game
+
+
+def checkpoint_schedule(K: int):
+    return EveryNSteps(max(K // PLOT_SPACING, 1))
+
+
+def run_trial(parameters: typing.Dict[str, typing.Any], trial: int, shared_game: SharedGame = None):
+    # one trial of an experiment, as lane `trial` of batched_independent_decentralized_algo would run it;
+    # only the checkpoints are returned, as arrays, so that results are cheap to send between processes.
+    # With a shared game the worker attaches the published tables instead of building its own
+    if shared_game is not None:
+        compiled_game = shared_game.attach()
+    else:
+        compiled_game = build_game(
+            **{name: parameters[name] for name in GAME_PARAMETERS}, anonymous=parameters.get("anonymous", False)
+        )
+    (alpha_r, beta_r) = (parameters["alpha_r"], parameters["beta_r"])
+    learner = IndependentDecentralizedLearner(
+        compiled_game, alpha=lambda n: 1/(n ** alpha_r), beta=lambda n: 1/(n ** beta_r), tau=parameters["tau"],
+        rng=random.Random(trial + 1)
+    )
+    K = parameters["K"]
+    return learner.run(K, schedule=checkpoint_schedule(K), record_trajectory=False)
+
+
+def run_jobs(fn: typing.Callable, jobs: typing.Dict[typing.Hashable, tuple], workers: int = None,
+             retries: int = 2):
+    # {key: fn(*args)} for every job, computed by a process pool; a job whose worker raised or died is
+    # resubmitted, in a fresh pool if the old one broke, up to `retries` times before the error propagates
+    workers = workers if workers is not None else os.cpu_count()
+    results = dict()
+    attempts = {key: 0 for key in jobs}
+    pending = dict(jobs)
+    while pending:
+        failed = dict()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(pending))) as executor:
+            futures = {executor.submit(fn, *args): key for (key, args) in pending.items()}
+            for future in concurrent.futures.as_completed(futures):
+                key = futures[future]
+                try:
+                    results[key] = future.result()
+                except Exception as e:
+                    attempts[key] += 1
+                    if attempts[key] > retries:
+                        raise RuntimeError(f"job {key} failed {attempts[key]} times") from e
+                    failed[key] = pending[key]
+        pending = failed
+    return results
+
+
+def stack_trials(histories: typing.List[LearningHistory]):
+    # single-lane histories of the trials of one experiment -> one history with a leading trial axis
+    return LearningHistory(
+        steps=histories[0].steps,
+        pi=np.stack([history.pi for history in histories]),
+        q_tilde=np.stack([history.q_tilde for history in histories]),
+        s=None, a=None,
+    )
+
+
+def run_experiments(experiments: typing.Dict[typing.Hashable, typing.Dict[str, typing.Any]], workers: int = None,
+                    retries: int = 2, cache: ResultCache = None):
+    # farms out one job per (experiment, trial) and returns {experiment: history over its trials};
+    # each game is built once here and published to the workers through shared memory.
+    # With a cache, games and finished trials are reused and only the missing trials run
+    results = dict()
+    if cache is not None:
+        for (key, parameters) in experiments.items():
+            for trial in range(parameters["N_trials"]):
+                history = cache.get(trial_key(parameters, trial))
+                if history is not None:
+                    results[(key, trial)] = history
+    missing = {
+        key: [trial for trial in range(parameters["N_trials"]) if (key, trial) not in results]
+        for (key, parameters) in experiments.items()
+    }
+    shared_games = dict()
+    try:
+        for (key, parameters) in experiments.items():
+            if missing[key]:
+                shared_games[key] = SharedGame(load_game(parameters, cache))
+        jobs = {
+            (key, trial): (parameters, trial, shared_games[key])
+            for (key, parameters) in experiments.items() for trial in missing[key]
+        }
+        computed = run_jobs(run_trial, jobs, workers=workers, retries=retries) if jobs else dict()
+    finally:
+        for shared_game in shared_games.values():
+            shared_game.close()
+    for ((key, trial), history) in computed.items():
+        if cache is not None:
+            cache.put(trial_key(experiments[key], trial), history)
+        results[(key, trial)] = history
+    return {
+        key: stack_trials([results[(key, trial)] for trial in range(parameters["N_trials"])])
+        for (key, parameters) in experiments.items()
+    }
@@ -0,0 +1,116 @@
+import itertools
+import typing
+
+import numpy as np
+
+from .game import *
+from .sparse import *
+
+
+def occupancy_vectors(N: int, M: int):
+    # all ways of placing N players on M actions, as an int array [C, M]
+    return np.array([
+        list(first) + [N - sum(first)]
+        for first in itertools.product(range(N + 1), repeat=M - 1) if sum(first) <= N
+    ], dtype=np.int64).reshape(-1, M)
+
+
+class AnonymousGame:
+    # a game in which every player has the same M actions and payoffs and transitions depend on the joint
+    # action only through the occupancy vector (number of players on each action) and on the player's own action
+    def __init__(self, player_set: PlayerSet, states: StateSet, M: int,
+                 mu: np.ndarray, P: np.ndarray, R: np.ndarray, delta: float,
+                 occupancies: typing.Optional[np.ndarray] = None):
+        self.I: PlayerSet = player_set
+        self.S: StateSet = states
+        self.delta: float = delta
+
+        self.I_list: typing.List[Player] = list(self.I)
+        self.S_list: typing.List[State] = list(self.S)
+        self.n_players: int = len(self.I_list)
+        self.n_states: int = len(self.S_list)
+        self.max_actions: int = M
+        self.n_actions: np.ndarray = np.full(shape=(self.n_players, ), fill_value=M, dtype=np.int64)
+        self.action_mask: np.ndarray = np.ones(shape=(self.n_players, M), dtype=bool)
+
+        # occupancy vectors are indexed through the counts of the first M - 1 actions in radix N + 1
+        self.occupancies: np.ndarray = occupancy_vectors(self.n_players, M) if occupancies is None else occupancies
+        self.n_joint_actions: int = len(self.occupancies)
+        self.radix: np.ndarray = (self.n_players + 1) ** np.arange(M - 2, -1, -1, dtype=np.int64)
+        self.occupancy_table: np.ndarray = np.full(shape=((self.n_players + 1) ** (M - 1), ), fill_value=-1,
+                                                   dtype=np.int64)
+        self.occupancy_table[self.occupancies[:, :-1] @ self.radix] = np.arange(self.n_joint_actions)
+
+        self.mu: np.ndarray = np.asarray(mu, dtype=np.float64)
+        self.P: np.ndarray = np.asarray(P, dtype=np.float64)  # [S, C, S]
+        self.R: np.ndarray = np.asarray(R, dtype=np.float64)  # [S, C, M], reward of a player on each action
+        assert self.mu.shape == (self.n_states, )
+        assert self.P.shape == (self.n_states, self.n_joint_actions, self.n_states)
+        assert self.R.shape == (self.n_states, self.n_joint_actions, M)
+        self.P_sparse: typing.Optional[SparseTransitionKernel] = None  # built by transition_sampler
+
+    def __repr__(self):
+        return f"AnonymousGame(N={self.n_players}, S={self.n_states}, M={self.max_actions}, " \
+               f"occupancies={self.n_joint_actions}, delta={self.delta})"
+
+    def occupancy_index(self, counts: np.ndarray):
+        return self.occupancy_table[np.asarray(counts, dtype=np.int64)[..., :-1] @ self.radix]
+
+    def encode_joint_action(self, action_indices: np.ndarray):
+        action_indices = np.asarray(action_indices, dtype=np.int64)
+        counts = (action_indices[..., None] == np.arange(self.max_actions)).sum(axis=-2)
+        return self.occupancy_index(counts)
+
+    def rewards(self, s: np.ndarray, a: np.ndarray, joint_action: np.ndarray):
+        # [B, N] rewards for states s [B], actions a [B, N] and their occupancy indices [B]
+        return self.R[s[:, None], joint_action[:, None], a]
+
+    def transition_sampler(self):
+        if self.P_sparse is None:
+            self.P_sparse = SparseTransitionKernel.from_dense(self.P)
+        return self.P_sparse
+
+    def uniform_policy(self):
+        return np.full(shape=(self.n_players, self.n_states, self.max_actions), fill_value=1 / self.max_actions)
+
+    def opponent_occupancy_distribution(self, i: int, pi: np.ndarray):
+        # Poisson-multinomial distribution of the other players' occupancy vector in every state, over the
+        # counts of the first M - 1 actions: [S, N, ..., N] (M - 1 axes of size N); players are added one at a time
+        M = self.max_actions
+        dist = np.zeros(shape=(self.n_states, ) + (self.n_players, ) * (M - 1))
+        dist[(slice(None), ) + (0, ) * (M - 1)] = 1.0
+        expand = (slice(None), ) + (None, ) * (M - 1)
+        for j in range(self.n_players):
+            if j == i:
+                continue
+            new_dist = dist * pi[j, :, M - 1][expand]
+            for r in range(M - 1):
+                source = [slice(None)] * M
+                target = [slice(None)] * M
+                source[1 + r] = slice(0, self.n_players - 1)
+                target[1 + r] = slice(1, self.n_players)
+                new_dist[tuple(target)] += dist[tuple(source)] * pi[j, :, r][expand]
+            dist = new_dist
+        return dist
+
+    def reduced_model(self, i: int, pi: np.ndarray):
+        # player i's model against the other players' policies in pi [N, S, M]:
+        # P_reduced [S, M, S], R_reduced [S, M]
+        M = self.max_actions
+        dist = self.opponent_occupancy_distribution(i, pi).reshape(self.n_states, -1)
+        others = np.array(list(itertools.product(range(self.n_players), repeat=M - 1)), dtype=np.int64)
+        others = others.reshape(self.n_players ** (M - 1), M - 1)
+        valid = others.sum(axis=-1) <= self.n_players - 1
+        dist, others = dist[:, valid], others[valid]
+        others = np.concatenate([others, self.n_players - 1 - others.sum(axis=-1, keepdims=True)], axis=-1)
+        P_reduced = np.zeros(shape=(self.n_states, M, self.n_states))
+        R_reduced = np.zeros(shape=(self.n_states, M))
+        states = np.arange(self.n_states)[:, None]
+        for r in range(M):
+            c = self.occupancy_index(others + np.eye(M, dtype=np.int64)[r])
+            P_reduced[:, r] = np.einsum("sc,sct->st", dist, self.P[:, c])
+            R_reduced[:, r] = (dist * self.R[states, c[None, :], r]).sum(axis=-1)
+        return P_reduced, R_reduced
+
+
+__all__ = ["occupancy_vectors", "AnonymousGame"]
@@ -0,0 +1,128 @@
+import collections
+import hashlib
+import json
+import os
+import pathlib
+import pickle
+import shutil
+import typing
+
+
+VALUE_FILE = "value.pkl"
+DIRECTORY = "data"
+DIRECTORY_MARKER = "complete"
+
+
+def content_key(*parts):
+    # stable hash of JSON-like parts (parameters, hyperparameters, ...); tuples and lists hash alike
+    blob = json.dumps(parts, sort_keys=True, default=repr, separators=(",", ":"))
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class ResultCache:
+    # content-addressed store of picklable values or of directories written by a callback, one entry per key;
+    # the modification time of an entry records its last use, and the least recently used entries are
+    # evicted beyond max_bytes
+    def __init__(self, root: pathlib.Path, max_bytes: int = 2 ** 34):
+        self.root: pathlib.Path = pathlib.Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes: int = max_bytes
+        # keys of entries in use by this process (memory-mapped games, ...), which evict leaves alone
+        self.pinned: typing.Counter[str] = collections.Counter()
+
+    def __repr__(self):
+        return f"ResultCache({self.root}, entries={len(self.entries())}, bytes={self.size()}, max_bytes={self.max_bytes})"
+
+    def __contains__(self, key: str):
+        return self.complete(self.root / key)
+
+    @staticmethod
+    def complete(entry: pathlib.Path):
+        return (entry / VALUE_FILE).exists() or (entry / DIRECTORY_MARKER).exists()
+
+    def entries(self):
+        return [entry for entry in self.root.iterdir() if self.complete(entry)]
+
+    @staticmethod
+    def entry_size(entry: pathlib.Path):
+        return sum(f.stat().st_size for f in entry.rglob("*") if f.is_file())
+
+    def size(self):
+        return sum(self.entry_size(entry) for entry in self.entries())
+
+    def touch(self, key: str):
+        os.utime(self.root / key)
+
+    def get(self, key: str, default=None):
+        if not (self.root / key / VALUE_FILE).exists():
+            return default
+        with open(self.root / key / VALUE_FILE, "rb") as f:
+            value = pickle.load(f)
+        self.touch(key)
+        return value
+
+    def put(self, key: str, value):
+        # written next to the entry and renamed into place, so readers never see a partial value
+        entry = self.root / key
+        entry.mkdir(exist_ok=True)
+        partial = entry / f"{VALUE_FILE}.partial"
+        with open(partial, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(partial, entry / VALUE_FILE)
+        self.touch(key)
+        self.evict(keep=key)
+
+    def get_directory(self, key: str):
+        # path of a directory entry, or None
+        if not (self.root / key / DIRECTORY_MARKER).exists():
+            return None
+        self.touch(key)
+        return self.root / key / DIRECTORY
+
+    def put_directory(self, key: str, write: typing.Callable[[pathlib.Path], typing.Any]):
+        # write(path) fills a directory next to the entry's, which is renamed into place once write has returned;
+        # the marker is removed first, so readers never see a complete entry with partial data. Files of a
+        # replaced directory that are still memory-mapped stay readable until they are unmapped
+        entry = self.root / key
+        entry.mkdir(exist_ok=True)
+        (entry / DIRECTORY_MARKER).unlink(missing_ok=True)
+        partial = entry / f"{DIRECTORY}.partial-{os.getpid()}"
+        stale = entry / f"{DIRECTORY}.stale-{os.getpid()}"
+        shutil.rmtree(partial, ignore_errors=True)
+        partial.mkdir()
+        write(partial)
+        if (entry / DIRECTORY).exists():
+            os.replace(entry / DIRECTORY, stale)
+        os.replace(partial, entry / DIRECTORY)
+        (entry / DIRECTORY_MARKER).touch()
+        shutil.rmtree(stale, ignore_errors=True)
+        self.touch(key)
+        self.evict(keep=key)
+        return entry / DIRECTORY
+
+    def pin(self, key: str):
+        self.pinned[key] += 1
+
+    def unpin(self, key: str):
+        self.pinned[key] -= 1
+        if self.pinned[key] <= 0:
+            del self.pinned[key]
+
+    def evict(self, keep: typing.Optional[str] = None):
+        entries = sorted(self.entries(), key=lambda entry: entry.stat().st_mtime)
+        sizes = {entry: self.entry_size(entry) for entry in entries}
+        total = sum(sizes.values())
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            if entry.name == keep or entry.name in self.pinned:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= sizes[entry]
+
+    def clear(self):
+        for entry in self.entries():
+            shutil.rmtree(entry, ignore_errors=True)
+
+
+__all__ = ["content_key", "ResultCache"]
@@ -0,0 +1,134 @@
+import typing
+
+import numpy as np
+
+from .game import *
+from .sparse import *
+from .q_learning import *
+
+
+class CompiledGame:
+    def __init__(self, player_set: PlayerSet, states: StateSet, joint_actions: ActionProfileSet,
+                 mu: np.ndarray, P: np.ndarray, R: np.ndarray, delta: float,
+                 joint_action_table: typing.Optional[np.ndarray] = None):
+        self.I: PlayerSet = player_set
+        self.S: StateSet = states
+        self.A: ActionProfileSet = joint_actions
+        self.delta: float = delta
+
+        # bidirectional index maps
+        self.I_list: typing.List[Player] = list(self.I)
+        self.player_index: typing.Dict[Player, int] = {i: idx for (idx, i) in enumerate(self.I_list)}
+        self.S_list: typing.List[State] = list(self.S)
+        self.state_index: typing.Dict[State, int] = {s: idx for (idx, s) in enumerate(self.S_list)}
+        self.Ai_lists: typing.List[typing.List[Action]] = [list(self.A[i]) for i in self.I_list]
+        self.action_index: typing.List[typing.Dict[Action, int]] = [
+            {a_i: idx for (idx, a_i) in enumerate(Ai_list)} for Ai_list in self.Ai_lists
+        ]
+
+        self.n_players: int = len(self.I_list)
+        self.n_states: int = len(self.S_list)
+        self.n_joint_actions: int = self.A.size  # joint actions are looked up with self.A.index / self.A.profile
+        self.n_actions: np.ndarray = np.array([len(Ai_list) for Ai_list in self.Ai_lists], dtype=np.int64)
+        self.max_actions: int = int(self.n_actions.max())
+        self.action_mask: np.ndarray = np.arange(self.max_actions)[None, :] < self.n_actions[:, None]
+
+        # joint actions are enumerated as the product of the action sets, i.e. in mixed radix
+        set_order = [action_set.player for action_set in self.A.action_sets]
+        set_sizes = [len(action_set) for action_set in self.A.action_sets]
+        set_strides = [int(np.prod(set_sizes[pos + 1:], dtype=np.int64)) for pos in range(len(set_sizes))]
+        self.strides: np.ndarray = np.array([set_strides[set_order.index(i)] for i in self.I_list], dtype=np.int64)
+        self.joint_action_shape: typing.Tuple[int, ...] = tuple(set_sizes)  # joint action axis unravelled
+        self.player_axes: np.ndarray = np.array([set_order.index(i) for i in self.I_list], dtype=np.int64)
+        # [|A|, N] action indices of each joint action, unravelled unless given (e.g. loaded with the game)
+        if joint_action_table is None:
+            digits = np.indices(self.joint_action_shape, dtype=np.int64).reshape(len(set_sizes), self.n_joint_actions)
+            joint_action_table = np.ascontiguousarray(digits.T[:, self.player_axes])
+        self.joint_actions: np.ndarray = joint_action_table
+        assert self.joint_actions.shape == (self.n_joint_actions, self.n_players)
+
+        self.mu: np.ndarray = np.asarray(mu, dtype=np.float64)
+        self.P: np.ndarray = np.asarray(P, dtype=np.float64)
+        self.R: np.ndarray = np.asarray(R, dtype=np.float64)
+        assert self.mu.shape == (self.n_states, )
+        assert self.P.shape == (self.n_states, self.n_joint_actions, self.n_states)
+        assert self.R.shape == (self.n_players, self.n_states, self.n_joint_actions)
+        self.P_sparse: typing.Optional[SparseTransitionKernel] = None  # built by transition_sampler
+
+    def __repr__(self):
+        return f"CompiledGame(N={self.n_players}, S={self.n_states}, A={self.n_joint_actions}, delta={self.delta})"
+
+    def encode_joint_action(self, action_indices: np.ndarray):
+        return np.asarray(action_indices, dtype=np.int64) @ self.strides
+
+    def decode_joint_action(self, joint_action_index):
+        return self.joint_actions[joint_action_index]
+
+    def rewards(self, s: np.ndarray, a: np.ndarray, joint_action: np.ndarray):
+        # [B, N] rewards for states s [B], actions a [B, N] and their joint action indices [B]
+        return self.R[np.arange(self.n_players)[None, :], s[:, None], joint_action[:, None]]
+
+    def transition_sampler(self):
+        if self.P_sparse is None:
+            self.P_sparse = SparseTransitionKernel.from_dense(self.P)
+        return self.P_sparse
+
+    def uniform_policy(self):
+        return np.broadcast_to(
+            np.where(self.action_mask, 1 / self.n_actions[:, None], 0.0)[:, None, :],
+            (self.n_players, self.n_states, self.max_actions)
+        ).copy()
+
+    def policy_array(self, pi: JointPolicy):
+        pi_array = np.zeros(shape=(self.n_players, self.n_states, self.max_actions))
+        for (idx, i) in enumerate(self.I_list):
+            pi_array[idx, :, :self.n_actions[idx]] = self.player_array(pi[i], pi[i].joint_states, pi[i].actions, idx)
+        return pi_array
+
+    def joint_policy(self, pi_array: np.ndarray):
+        return JointPolicy({
+            i: Policy(self.S, self.A[i], array=np.array(pi_array[idx, :, :self.n_actions[idx]], dtype=np.float64))
+            for (idx, i) in enumerate(self.I_list)
+        })
+
+    def local_q_array(self, q_tilde: JointLocalQFunction):
+        q_array = np.zeros(shape=(self.n_players, self.n_states, self.max_actions))
+        for (idx, i) in enumerate(self.I_list):
+            q_array[idx, :, :self.n_actions[idx]] = self.player_array(
+                q_tilde[i], q_tilde[i].states, q_tilde[i].actions, idx
+            )
+        return q_array
+
+    def joint_local_q_function(self, q_array: np.ndarray):
+        return JointLocalQFunction({
+            i: LocalQFunction(self.S, self.A[i],
+                              array=np.array(q_array[idx, :, :self.n_actions[idx]], dtype=np.float64))
+            for (idx, i) in enumerate(self.I_list)
+        })
+
+    def player_array(self, fn: typing.Union[Policy, LocalQFunction], states: StateSet, actions: ActionSet, idx: int):
+        # fn.array [|S|, |A_i|] reordered to the game's states and player idx's actions
+        rows = [states.index(s) for s in self.S_list]
+        columns = [actions.index(a_i) for a_i in self.Ai_lists[idx]]
+        return fn.array[np.ix_(rows, columns)]
+
+
+def compile_game(game: StochasticGame):
+    S_list = list(game.S)
+    I_list = list(game.I)
+
+    mu = np.array([game.mu[s] for s in S_list], dtype=np.float64)
+
+    P = np.zeros(shape=(len(S_list), game.A.size, len(S_list)))
+    for ((s, a, s_prime), pr) in game.P.kernel.items():
+        P[game.S.index(s), game.A.index(a), game.S.index(s_prime)] = pr
+
+    R = np.zeros(shape=(len(I_list), len(S_list), game.A.size))
+    for (idx, i) in enumerate(I_list):
+        for ((s, a), r) in game.R.kernel[i].items():
+            R[idx, game.S.index(s), game.A.index(a)] = r
+
+    return CompiledGame(game.I, game.S, game.A, mu, P, R, game.delta)
+
+
+__all__ = ["CompiledGame", "compile_game"]
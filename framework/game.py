@@ -1,13 +1,19 @@
+import collections.abc
 import functools
 import itertools
 import math
 import numbers
 import random
 import typing
+import weakref
+
+import numpy as np
 
 
 @functools.total_ordering
 class Player:
+    __slots__ = ("idx", "label")
+
     def __init__(self, idx: int, label: str = None):
         self.idx: int = idx
         self.label: str = label
@@ -37,12 +43,15 @@ class Player:
 
 @functools.total_ordering
 class State:
+    __slots__ = ("value", "label", "hash_value")
+
     def __init__(self, value: numbers.Number, label: str = None):
         self.value: numbers.Number = value
         self.label: str = label
+        self.hash_value: int = hash(value)
 
     def __hash__(self):
-        return hash(self.value)
+        return self.hash_value
 
     def __eq__(self, other):
         return isinstance(other, State) and other.value == self.value
@@ -59,13 +68,16 @@ class State:
 
 @functools.total_ordering
 class Action:
+    __slots__ = ("player", "value", "label", "hash_value")
+
     def __init__(self, player: Player, value: numbers.Number, label: str = None):
         self.player: Player = player
         self.value: numbers.Number = value
         self.label: str = label
+        self.hash_value: int = hash((hash(player), hash(value)))
 
     def __hash__(self):
-        return hash(self.player) + hash(self.value)
+        return self.hash_value
 
     def __eq__(self, other):
         return isinstance(other, Action) and other.player == self.player and other.value == self.value
@@ -81,28 +93,47 @@ class Action:
 
 
 class ActionProfile:
+    __slots__ = ("player_action_map", "hash_value", "__weakref__")
+
+    # canonical instances by their set of actions, alive as long as something else refers to them
+    interned: "weakref.WeakValueDictionary[typing.FrozenSet[Action], ActionProfile]" = weakref.WeakValueDictionary()
+
     def __init__(self, actions: typing.List[Action]):
         self.player_action_map: typing.Dict[Player, Action] = {action.player: action for action in actions}
+        # order-independent and well mixed: a sum of the actions' hashes collides for most profiles
+        self.hash_value: int = hash(frozenset(self.player_action_map.values()))
 
     def __getitem__(self, item):
         return self.player_action_map[item]
 
     def __eq__(self, other):
-        return isinstance(other, ActionProfile) and self.player_action_map == other.player_action_map
+        return self is other or (
+            isinstance(other, ActionProfile) and self.hash_value == other.hash_value
+            and self.player_action_map == other.player_action_map
+        )
 
     def __hash__(self):
-        players = sorted(list(self.player_action_map.keys()))
-        return sum(hash(self.player_action_map[players[i]]) for i in range(len(players)))
+        return self.hash_value
 
     def __repr__(self):
         return repr(self.player_action_map)
 
+    @staticmethod
+    def intern(actions: typing.Iterable[Action]):
+        actions = list(actions)
+        key = frozenset(actions)
+        profile = ActionProfile.interned.get(key)
+        if profile is None:
+            profile = ActionProfile(actions)
+            ActionProfile.interned[key] = profile
+        return profile
+
     def minus(self, player: Player):
-        return ActionProfile([self.player_action_map[p] for p in self.player_action_map.keys() if p != player])
+        return ActionProfile.intern(self.player_action_map[p] for p in self.player_action_map.keys() if p != player)
 
     @staticmethod
     def merge(a_i: Action, a_minus_i):
-        return ActionProfile([a_i] + list(a_minus_i.player_action_map.values()))
+        return ActionProfile.intern([a_i] + list(a_minus_i.player_action_map.values()))
 
 
 class PlayerSet:
@@ -125,6 +156,7 @@ class PlayerSet:
 class StateSet:
     def __init__(self, states: typing.List[State]):
         self.states: typing.List[State] = list(states)
+        self.state_index: typing.Dict[State, int] = {s: idx for (idx, s) in enumerate(self.states)}
 
     def __hash__(self):
         return sum(hash(state) for state in self.states)
@@ -141,11 +173,15 @@ class StateSet:
     def __repr__(self):
         return repr(self.states)
 
+    def index(self, s: State):
+        return self.state_index[s]
+
 
 class ActionSet:
     def __init__(self, player: Player, actions: typing.List[Action]):
         self.player: Player = player
         self.actions: typing.List[Action] = list(actions)
+        self.action_index: typing.Dict[Action, int] = {a: idx for (idx, a) in enumerate(self.actions)}
 
     def __hash__(self):
         return sum(hash(action) for action in self.actions)
@@ -162,38 +198,73 @@ class ActionSet:
     def __repr__(self):
         return repr(self.actions)
 
+    def index(self, a: Action):
+        return self.action_index[a]
+
 
 class ActionProfileSet:
+    # joint actions are never materialized: they are enumerated in mixed radix over the action sets,
+    # the first action set being the most significant digit (the order of itertools.product)
     def __init__(self, action_sets: typing.List[ActionSet]):
-        self.action_sets: typing.List[ActionSet] = action_sets
-        action_lists: typing.List[typing.List[Action]] = [action_set.actions for action_set in self.action_sets]
-        self.joint_actions: typing.List[ActionProfile] = [
-            ActionProfile(list(joint_action)) for joint_action in itertools.product(*action_lists)
+        self.action_sets: typing.List[ActionSet] = list(action_sets)
+        self.player_action_sets: typing.Dict[Player, ActionSet] = {
+            action_set.player: action_set for action_set in self.action_sets
+        }
+        self.action_indices: typing.List[typing.Dict[Action, int]] = [
+            {a_i: idx for (idx, a_i) in enumerate(action_set)} for action_set in self.action_sets
         ]
+        self.sizes: typing.List[int] = [len(action_set) for action_set in self.action_sets]
+        self.strides: typing.List[int] = [math.prod(self.sizes[pos + 1:]) for pos in range(len(self.sizes))]
+        self.size: int = math.prod(self.sizes)  # len() is limited to sys.maxsize
+        self.minus_views: typing.Dict[Player, ActionProfileSet] = dict()
+
+    @property
+    def joint_actions(self):
+        return list(iter(self))
 
     def __hash__(self):
-        return sum(hash(joint_action) for joint_action in self.joint_actions)
+        return sum(hash(action_set) for action_set in self.action_sets)
 
     def __eq__(self, other):
-        return isinstance(other, ActionProfileSet) and self.joint_actions == other.joint_actions
+        return isinstance(other, ActionProfileSet) and self.action_sets == other.action_sets
 
     def __iter__(self):
-        return iter(self.joint_actions)
+        action_lists = [action_set.actions for action_set in self.action_sets]
+        return (ActionProfile.intern(joint_action) for joint_action in itertools.product(*action_lists))
 
     def __len__(self):
-        return len(self.joint_actions)
+        return self.size
 
     def __getitem__(self, item):
-        return [self.action_sets[i] for i in range(len(self.action_sets)) if item == self.action_sets[i].player][0]
+        return self.player_action_sets[item]
+
+    def __contains__(self, item):
+        return isinstance(item, ActionProfile) and len(item.player_action_map) == len(self.action_sets) and all(
+            action_set.player in item.player_action_map and item[action_set.player] in self.action_indices[pos]
+            for (pos, action_set) in enumerate(self.action_sets)
+        )
 
     def __repr__(self):
-        return repr(self.joint_actions)
+        return repr(list(iter(self)))
+
+    def index(self, a: ActionProfile):
+        return sum(
+            self.action_indices[pos][a[action_set.player]] * self.strides[pos]
+            for (pos, action_set) in enumerate(self.action_sets)
+        )
+
+    def profile(self, index: int):
+        return ActionProfile.intern([
+            action_set.actions[(index // self.strides[pos]) % self.sizes[pos]]
+            for (pos, action_set) in enumerate(self.action_sets)
+        ])
 
     def minus(self, player: Player):
-        return ActionProfileSet([
-            self.action_sets[i] for i in range(len(self.action_sets))
-            if player != self.action_sets[i].player
-        ])
+        if player not in self.minus_views:
+            self.minus_views[player] = ActionProfileSet([
+                action_set for action_set in self.action_sets if player != action_set.player
+            ])
+        return self.minus_views[player]
 
 
 class ProbabilityTransitionKernel:
@@ -204,6 +275,9 @@ class ProbabilityTransitionKernel:
 
         triples = itertools.product(self.state_set, self.joint_action_set, self.state_set)
         self.kernel = {(s, a, s_prime): kernel(s, a, s_prime) for (s, a, s_prime) in triples}
+        # nonzero next states of (s, a) and their cumulative weights, built on first use
+        self.sampling_tables: typing.Dict[typing.Tuple[State, ActionProfile],
+                                          typing.Tuple[typing.List[State], typing.List[float]]] = dict()
 
     def __getitem__(self, item):
         return self.kernel[item]
@@ -211,13 +285,92 @@ class ProbabilityTransitionKernel:
     def __repr__(self):
         return repr(self.kernel)
 
-    def sample_next_state(self, s: State, a: ActionProfile):
-        s_prime_values: typing.List[State] = list(iter(self.state_set))
-        s_prime_probabilities: typing.List[float] = [self.kernel[(s, a, s_prime)] for s_prime in s_prime_values]
-        s_prime: State = random.choices(population=s_prime_values, weights=s_prime_probabilities)[0]
+    def sampling_table(self, s: State, a: ActionProfile):
+        if (s, a) not in self.sampling_tables:
+            s_prime_values = [s_prime for s_prime in self.state_set if self.kernel[(s, a, s_prime)] != 0.0]
+            cum_weights = list(itertools.accumulate(self.kernel[(s, a, s_prime)] for s_prime in s_prime_values))
+            self.sampling_tables[(s, a)] = (s_prime_values, cum_weights)
+        return self.sampling_tables[(s, a)]
+
+    def sample_next_state(self, s: State, a: ActionProfile, rng=random):
+        # zero-probability states are never drawn, so dropping them leaves the draw unchanged
+        (s_prime_values, cum_weights) = self.sampling_table(s, a)
+        s_prime: State = rng.choices(population=s_prime_values, cum_weights=cum_weights)[0]
         return s_prime
 
 
+class FactoredTransitionKernel:
+    # for states whose value is a tuple of factors that transition independently given (s, a):
+    # factor_kernel(f, s, a) is the distribution of the next value of factor f over factor_values[f]
+    def __init__(self, state_set: StateSet, action_profile_set: ActionProfileSet,
+                 factor_values: typing.List[typing.List[numbers.Number]],
+                 factor_kernel: typing.Callable[[int, State, ActionProfile], typing.List[float]]):
+        self.state_set = state_set
+        self.joint_action_set = action_profile_set
+        self.factor_values: typing.List[typing.List[numbers.Number]] = [list(values) for values in factor_values]
+        self.factor_kernel = factor_kernel
+        self.factor_value_indices: typing.List[typing.Dict[numbers.Number, int]] = [
+            {v: idx for (idx, v) in enumerate(values)} for values in self.factor_values
+        ]
+        self.states_by_value: typing.Dict[typing.Any, State] = {s.value: s for s in self.state_set}
+        self.factor_distributions: typing.Dict[typing.Tuple[State, ActionProfile], typing.List[typing.List[float]]] = dict()
+        self.dense_kernel: typing.Optional[ProbabilityTransitionKernel] = None
+        # position of every state in the flattened grid of factor values, built on first use
+        self.grid_positions: typing.Optional[np.ndarray] = None
+
+    def __getitem__(self, item):
+        (s, a, s_prime) = item
+        return math.prod(
+            dist[self.factor_value_indices[f][s_prime.value[f]]] for (f, dist) in enumerate(self.distributions(s, a))
+        )
+
+    def __repr__(self):
+        return f"FactoredTransitionKernel({len(self.state_set)} states, {len(self.factor_values)} factors)"
+
+    @property
+    def kernel(self):
+        return self.dense().kernel
+
+    def distributions(self, s: State, a: ActionProfile):
+        if (s, a) not in self.factor_distributions:
+            self.factor_distributions[(s, a)] = [
+                list(self.factor_kernel(f, s, a)) for f in range(len(self.factor_values))
+            ]
+        return self.factor_distributions[(s, a)]
+
+    def dense(self):
+        if self.dense_kernel is None:
+            self.dense_kernel = ProbabilityTransitionKernel(
+                self.state_set, self.joint_action_set, lambda s, a, s_prime: self[(s, a, s_prime)]
+            )
+        return self.dense_kernel
+
+    def sample_next_state(self, s: State, a: ActionProfile, rng=random):
+        value = tuple(
+            rng.choices(population=values, weights=dist)[0]
+            for (values, dist) in zip(self.factor_values, self.distributions(s, a))
+        )
+        return self.states_by_value[value]
+
+    def grid_position_table(self):
+        if self.grid_positions is None:
+            self.grid_positions = np.ravel_multi_index(np.array([
+                [self.factor_value_indices[f][v] for (f, v) in enumerate(s_prime.value)] for s_prime in self.state_set
+            ], dtype=np.int64).reshape(len(self.state_set), len(self.factor_values)).T, self.grid_shape())
+        return self.grid_positions
+
+    def grid_shape(self):
+        return tuple(len(values) for values in self.factor_values)
+
+    def expected_value(self, s: State, a: ActionProfile, V: typing.Mapping[State, float]):
+        # E[V(s')] contracted one factor at a time over the grid of factor values
+        grid = np.zeros(shape=self.grid_shape())
+        grid.flat[self.grid_position_table()] = [V[s_prime] for s_prime in self.state_set]
+        for dist in self.distributions(s, a):
+            grid = np.tensordot(np.asarray(dist), grid, axes=(0, 0))
+        return float(grid)
+
+
 class InitialStateDistribution:
     def __init__(self, state_set: StateSet, kernel: typing.Callable[[State], float]):
         self.state_set = state_set
@@ -229,9 +382,9 @@ class InitialStateDistribution:
     def __repr__(self):
         return repr(self.kernel)
 
-    def sample_initial_state(self):
+    def sample_initial_state(self, rng=random):
         list_of_states = list(self.state_set)
-        s: State = random.choices(population=list_of_states, weights=[self.kernel[state] for state in list_of_states])[0]
+        s: State = rng.choices(population=list_of_states, weights=[self.kernel[state] for state in list_of_states])[0]
         return s
 
 
@@ -258,13 +411,14 @@ class RewardFunction:
 
 class StochasticGame:
     def __init__(self, player_set: PlayerSet, states: StateSet, joint_actions: ActionProfileSet,
-                 initial_distribution: InitialStateDistribution, probability_transition_kernel: ProbabilityTransitionKernel,
+                 initial_distribution: InitialStateDistribution,
+                 probability_transition_kernel: typing.Union[ProbabilityTransitionKernel, FactoredTransitionKernel],
                  reward_function: RewardFunction, delta: float):
         self.I: PlayerSet = player_set
         self.S: StateSet = states
         self.A: ActionProfileSet = joint_actions
         self.mu: InitialStateDistribution = initial_distribution
-        self.P: ProbabilityTransitionKernel = probability_transition_kernel
+        self.P: typing.Union[ProbabilityTransitionKernel, FactoredTransitionKernel] = probability_transition_kernel
         self.R: RewardFunction = reward_function
         self.delta: float = delta
 
@@ -272,35 +426,91 @@ class StochasticGame:
         return f"({repr(self.I)}, {repr(self.S)}, {repr(self.A)}, {repr(self.mu)}, {repr(self.P)}, {repr(self.R)}, {repr(self.delta)})"
 
 
+class KernelView(collections.abc.MutableMapping):
+    # live dict-like view of the entries of an array-backed function (Policy, LocalQFunction, ...): keys range over
+    # the product of the key sets (or the single key set), and reads and writes go through to the function's array
+    def __init__(self, fn, *key_sets):
+        self.fn = fn
+        self.key_sets = key_sets
+
+    def __getitem__(self, item):
+        return self.fn[item]
+
+    def __setitem__(self, key, value):
+        self.fn[key] = value
+
+    def __delitem__(self, key):
+        raise TypeError("entries of an array-backed function cannot be removed")
+
+    def __iter__(self):
+        return iter(self.key_sets[0]) if len(self.key_sets) == 1 else itertools.product(*self.key_sets)
+
+    def __len__(self):
+        return math.prod(len(key_set) for key_set in self.key_sets)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
 class Policy:
+    # pi[s, a_i] is stored in array[state index, action index]; the (s, a_i) keys are kept for compatibility
     def __init__(self, states: StateSet, actions: ActionSet,
-                 initialization_policy: typing.Callable[[State, Action], float]):
+                 initialization_policy: typing.Optional[typing.Callable[[State, Action], float]] = None,
+                 array: typing.Optional[np.ndarray] = None):
         self.joint_states: StateSet = states
         self.actions: ActionSet = actions
-        self.kernel: typing.Dict[typing.Tuple[State, Action], float] = {
-            (s, a): initialization_policy(s, a)
-            for (s, a) in itertools.product(states, actions)
-        }
+        if array is None:
+            array = np.array([[initialization_policy(s, a) for a in actions] for s in states], dtype=np.float64)
+        self.array: np.ndarray = array.reshape(len(states), len(actions))  # [|S|, |A_i|]
+
+    @property
+    def kernel(self):
+        return KernelView(self, self.joint_states, self.actions)
 
     def __getitem__(self, item):
-        return self.kernel[item]
+        (s, a) = item
+        return float(self.array[self.joint_states.index(s), self.actions.index(a)])
 
     def __setitem__(self, key, value):
-        self.kernel[key] = value
+        (s, a) = key
+        self.array[self.joint_states.index(s), self.actions.index(a)] = value
 
     def __repr__(self):
         return repr(self.kernel)
 
-    def sample_action(self, s: State):
-        a_values: typing.List[Action] = list(self.actions)
-        a_probabilities: typing.List[float] = [self.kernel[(s, a)] for a in a_values]
-        a: Action = random.choices(population=a_values, weights=a_probabilities)[0]
+    def sample_action(self, s: State, rng=random):
+        a_probabilities: typing.List[float] = self.array[self.joint_states.index(s)].tolist()
+        a: Action = rng.choices(population=self.actions.actions, weights=a_probabilities)[0]
         return a
 
 
+def stack_arrays(player_fn_map: typing.Dict[Player, typing.Any]):
+    # moves the players' arrays [|S|, |A_i|, ...] into one zero-padded buffer [N, |S|, max |A_i|, ...] and
+    # rebinds each to its view of it. A function follows the last buffer it was stacked into: once stacked again
+    # (into a second joint function), writes to it no longer show in the first buffer, which keeps its old values
+    fns = list(player_fn_map.values())
+    if len(fns) == 0:
+        return np.zeros(shape=(0, 0, 0))
+    shape = (len(fns), ) + tuple(max(fn.array.shape[axis] for fn in fns) for axis in range(fns[0].array.ndim))
+    buffer = np.zeros(shape=shape, dtype=np.float64)
+    for (idx, fn) in enumerate(fns):
+        view = buffer[(idx, ) + tuple(slice(0, n) for n in fn.array.shape)]
+        view[...] = fn.array
+        fn.array = view
+    return buffer
+
+
 class JointPolicy:
-    def __init__(self, player_policy_map: typing.Dict[Player, Policy]):
+    # the players' policies share one buffer, array[player, state index, action index], unless stack is False
+    # (as for the views returned by minus, which leave their players' policies where they are). A policy belongs
+    # to one stacked joint policy at a time (see stack_arrays): to put it in another, copy it first
+    def __init__(self, player_policy_map: typing.Dict[Player, Policy], stack: bool = True):
         self.player_policy_map: typing.Dict[Player, Policy] = player_policy_map
+        self.array: typing.Optional[np.ndarray] = stack_arrays(player_policy_map) if stack else None
+
+    def __reduce__(self):
+        # copies and unpickled instances stack their (copied) policies again
+        return JointPolicy, (self.player_policy_map, self.array is not None)
 
     def __getitem__(self, item):
         return self.player_policy_map[item]
@@ -312,14 +522,19 @@ class JointPolicy:
         return math.prod(self.player_policy_map[i][(s, a[i])] for i in self.player_policy_map.keys())
 
     def minus(self, player: Player):
-        return JointPolicy({p: self.player_policy_map[p] for p in self.player_policy_map.keys() if p != player})
-
-    def sample_joint_action(self, s: State):
-        return ActionProfile([policy.sample_action(s) for policy in self.player_policy_map.values()])
+        return JointPolicy({p: self.player_policy_map[p] for p in self.player_policy_map.keys() if p != player},
+                           stack=False)
+
+    def sample_joint_action(self, s: State, rng=random):
+        # rng is either one stream shared by all players or a dict giving each player its own
+        return ActionProfile([
+            policy.sample_action(s, rng[i] if isinstance(rng, dict) else rng)
+            for (i, policy) in self.player_policy_map.items()
+        ])
 
 
 __all__ = [
     "Player", "PlayerSet", "State", "StateSet", "Action", "ActionSet", "ActionProfile", "ActionProfileSet",
-    "ProbabilityTransitionKernel", "RewardFunction", "InitialStateDistribution",
-    "StochasticGame", "Policy", "JointPolicy"
+    "ProbabilityTransitionKernel", "FactoredTransitionKernel", "RewardFunction", "InitialStateDistribution",
+    "StochasticGame", "KernelView", "Policy", "JointPolicy"
 ]
@@ -0,0 +1,112 @@
+import abc
+import typing
+
+import numpy as np
+
+from .compiled import *
+from .recording import *
+
+
+def read_only(x: np.ndarray):
+    view = x.view()
+    view.flags.writeable = False
+    return view
+
+
+class LearnerState:
+    # read-only views of a learner's tables, refreshed after every step k
+    def __init__(self, game: CompiledGame, pi: np.ndarray, q_tilde: np.ndarray, N: np.ndarray,
+                 N_tilde: np.ndarray, reward_sum: np.ndarray):
+        self.game: CompiledGame = game
+        self.pi: np.ndarray = read_only(pi)  # [B, N, S, max|A_i|], pi^{k+1}
+        self.q_tilde: np.ndarray = read_only(q_tilde)  # [B, N, S, max|A_i|], q_tilde^{k+1}
+        self.N: np.ndarray = read_only(N)  # [B, S]
+        self.N_tilde: np.ndarray = read_only(N_tilde)  # [B, N, S, max|A_i|]
+        self.reward_sum: np.ndarray = read_only(reward_sum)  # [B, N], rewards collected in steps 0, ..., k
+        self.k: int = -1
+        self.s_k: typing.Optional[np.ndarray] = None  # [B]
+        self.a_k: typing.Optional[np.ndarray] = None  # [B, N]
+        self.s: typing.Optional[np.ndarray] = None  # [B], s_{k+1}
+
+    def update(self, k: int, s_k: np.ndarray, a_k: np.ndarray, s: np.ndarray):
+        self.k = k
+        self.s_k = read_only(s_k)
+        self.a_k = read_only(a_k)
+        self.s = read_only(s)
+
+
+class LearnerHook:
+    def __init__(self, schedule: RecordingSchedule = None):
+        self.schedule: RecordingSchedule = schedule if schedule is not None else EveryNSteps(1)
+
+    def on_start(self, K: int, state: LearnerState):
+        pass
+
+    def on_step(self, k: int, state: LearnerState):
+        pass
+
+    def on_end(self, K: int, state: LearnerState):
+        pass
+
+
+class StreamingReducer(LearnerHook, abc.ABC):
+    def __init__(self, schedule: RecordingSchedule = None):
+        super().__init__(schedule)
+        self.steps: typing.List[int] = []
+        self.values: typing.List[np.ndarray] = []
+
+    @abc.abstractmethod
+    def reduce(self, state: LearnerState) -> np.ndarray:
+        pass
+
+    def on_step(self, k: int, state: LearnerState):
+        self.steps.append(k)
+        self.values.append(np.asarray(self.reduce(state)))
+
+    def result(self):
+        # (steps, values stacked along a leading checkpoint axis)
+        return np.array(self.steps, dtype=np.int64), np.stack(self.values) if self.values else np.zeros(shape=(0, ))
+
+
+class L1ChangeReducer(StreamingReducer):
+    # ||x^{k+1} - x^{k'+1}||_1 per lane and player, k' being the previous invocation
+    def __init__(self, attribute: str = "pi", schedule: RecordingSchedule = None):
+        super().__init__(schedule)
+        assert attribute in ("pi", "q_tilde")
+        self.attribute: str = attribute
+        self.last: typing.Optional[np.ndarray] = None
+
+    def on_start(self, K: int, state: LearnerState):
+        self.last = np.array(getattr(state, self.attribute))
+
+    def reduce(self, state: LearnerState):
+        current = getattr(state, self.attribute)
+        change = np.abs(current - self.last).sum(axis=(-2, -1))
+        self.last[...] = current
+        return change
+
+
+class PolicyEntropyReducer(StreamingReducer):
+    # entropy of pi_i(s, .) averaged over states, per lane and player
+    def reduce(self, state: LearnerState):
+        pi = state.pi
+        log_pi = np.log(np.where(pi > 0.0, pi, 1.0))
+        return -(pi * log_pi).sum(axis=-1).mean(axis=-1)
+
+
+class StateVisitationReducer(StreamingReducer):
+    # empirical state visitation distribution per lane
+    def reduce(self, state: LearnerState):
+        return state.N / state.N.sum(axis=-1, keepdims=True)
+
+
+class RunningRewardReducer(StreamingReducer):
+    # average reward collected so far, per lane and player
+    def reduce(self, state: LearnerState):
+        return state.reward_sum / (state.k + 1)
+
+
+__all__ = [
+    "read_only", "LearnerState", "LearnerHook", "StreamingReducer",
+    "L1ChangeReducer", "PolicyEntropyReducer", "StateVisitationReducer", "RunningRewardReducer"
+]
@@ -0,0 +1,107 @@
+import math
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+JIT_AVAILABLE = numba is not None
+
+
+def jit(fn):
+    # compiled with numba when it is installed; otherwise the plain Python function, which callers avoid
+    return numba.njit(cache=True)(fn) if numba is not None else fn
+
+
+@jit
+def learner_steps(T, pi, q_tilde, N, N_tilde, reward_sum, s, s_out, a_out, player_uniforms, environment_uniforms,
+                  n_actions, action_mask, strides, anonymous, radix, occupancy_table, R,
+                  P_indptr, P_indices, P_cum, P_row_totals, n_joint_actions, delta, tau, alpha_tables, beta_tables):
+    # T steps of every lane of BatchedIndependentDecentralizedLearner.step, entry by entry and in the same
+    # order of floating point operations, so that both backends agree bit for bit
+    (B, n_players, n_states, max_actions) = pi.shape
+    a = np.zeros(n_players, dtype=np.int64)
+    cum = np.zeros(max_actions)
+    counts = np.zeros(max_actions, dtype=np.int64)
+    numer = np.zeros(max_actions)
+    for t in range(T):
+        for b in range(B):
+            s_k = s[b]
+
+            # sample action, update state, collect reward
+            for i in range(n_players):
+                total = 0.0
+                for j in range(max_actions):
+                    total += pi[b, i, s_k, j]
+                    cum[j] = total
+                x = player_uniforms[t, b, i] * cum[max_actions - 1]
+                count = 0
+                for j in range(max_actions):
+                    if cum[j] <= x:
+                        count += 1
+                a[i] = min(count, max_actions - 1, n_actions[i] - 1)
+            if anonymous:
+                counts[:] = 0
+                for i in range(n_players):
+                    counts[a[i]] += 1
+                code = 0
+                for j in range(max_actions - 1):
+                    code += counts[j] * radix[j]
+                joint = occupancy_table[code]
+            else:
+                joint = 0
+                for i in range(n_players):
+                    joint += a[i] * strides[i]
+
+            N[b, s_k] += 1
+            for i in range(n_players):
+                N_tilde[b, i, s_k, a[i]] += 1
+
+            row = s_k * n_joint_actions + joint
+            start = P_indptr[row]
+            nnz = P_indptr[row + 1] - start
+            x = environment_uniforms[t, b] * P_row_totals[row]
+            count = 0
+            for e in range(nnz):
+                if P_cum[start + e] <= x:
+                    count += 1
+            s_next = P_indices[start + min(count, nnz - 1)]
+
+            # update beliefs, policies, Q functions; player i's reads all precede its writes
+            beta_k = beta_tables[b, N[b, s_k]]
+            for i in range(n_players):
+                nu = 0.0
+                expected_next = 0.0
+                for j in range(max_actions):
+                    p = pi[b, i, s_k, j]
+                    nu += 0.0 if p == 0.0 else p * math.log(p)
+                    expected_next += pi[b, i, s_next, j] * q_tilde[b, i, s_next, j]
+                r = R[s_k, joint, a[i]] if anonymous else R[i, s_k, joint]
+                alpha_k = alpha_tables[b, N_tilde[b, i, s_k, a[i]]]
+                q_sa = q_tilde[b, i, s_k, a[i]]
+                new_q_sa = q_sa + alpha_k * (r - (tau[b] * nu) + delta * expected_next - q_sa)
+
+                max_q_tilde = -math.inf
+                for j in range(max_actions):
+                    if action_mask[i, j] and q_tilde[b, i, s_k, j] > max_q_tilde:
+                        max_q_tilde = q_tilde[b, i, s_k, j]
+                denom = 0.0
+                for j in range(max_actions):
+                    numer[j] = math.exp((q_tilde[b, i, s_k, j] - max_q_tilde) / tau[b]) if action_mask[i, j] else 0.0
+                    denom += numer[j]
+                for j in range(max_actions):
+                    pi[b, i, s_k, j] = pi[b, i, s_k, j] + beta_k * (numer[j] / denom - pi[b, i, s_k, j])
+                q_tilde[b, i, s_k, a[i]] = new_q_sa
+                reward_sum[b, i] += r
+
+            s_out[b, t] = s_k
+            for i in range(n_players):
+                a_out[b, t, i] = a[i]
+            # transition to next state
+            s[b] = s_next
+
+
+__all__ = ["JIT_AVAILABLE", "jit", "learner_steps"]
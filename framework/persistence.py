@@ -0,0 +1,116 @@
+import json
+import pathlib
+import typing
+
+import numpy as np
+
+from .game import *
+from .compiled import *
+from .anonymous import *
+from .sparse import *
+
+
+GAME_META_FILE = "game.json"
+GAME_FORMAT = 1
+GAME_ARRAYS = ("mu", "P", "R")
+# the joint action table of each kind of game, saved so that loading does not enumerate joint actions again
+JOINT_ACTION_TABLES = {"compiled": "joint_actions", "anonymous": "occupancies"}
+SAMPLER_ARRAYS = ("indptr", "indices", "data", "cum")
+
+
+def to_json_value(value):
+    # tuple-valued states are stored as lists
+    if isinstance(value, (tuple, list)):
+        return [to_json_value(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def from_json_value(value):
+    if isinstance(value, list):
+        return tuple(from_json_value(v) for v in value)
+    return value
+
+
+def game_description(game: typing.Union[CompiledGame, AnonymousGame]):
+    # everything about a compiled game but its tables, as JSON-like values: a few entries per player, state and action
+    description = {
+        "format": GAME_FORMAT,
+        "kind": "anonymous" if isinstance(game, AnonymousGame) else "compiled",
+        "delta": game.delta,
+        "players": [[i.idx, i.label] for i in game.I],
+        "states": [[to_json_value(s.value), s.label] for s in game.S],
+    }
+    if isinstance(game, AnonymousGame):
+        description["M"] = game.max_actions
+    else:
+        description["action_sets"] = [
+            [action_set.player.idx, [[to_json_value(a_i.value), a_i.label] for a_i in action_set]]
+            for action_set in game.A.action_sets
+        ]
+    return description
+
+
+def game_arrays(game: typing.Union[CompiledGame, AnonymousGame]):
+    kind = "anonymous" if isinstance(game, AnonymousGame) else "compiled"
+    return {name: getattr(game, name) for name in GAME_ARRAYS + (JOINT_ACTION_TABLES[kind], )}
+
+
+def game_from_description(description: typing.Dict[str, typing.Any], arrays: typing.Dict[str, np.ndarray]):
+    # the game of game_description around the given tables, which are used as they are (views, memory maps, ...)
+    assert description["format"] == GAME_FORMAT
+    players = {idx: Player(idx=idx, label=label) for (idx, label) in description["players"]}
+    I = PlayerSet(list(players.values()))
+    S = StateSet([State(value=from_json_value(value), label=label) for (value, label) in description["states"]])
+    if description["kind"] == "anonymous":
+        return AnonymousGame(I, S, description["M"], arrays["mu"], arrays["P"], arrays["R"], description["delta"],
+                             occupancies=arrays.get("occupancies"))
+    A = ActionProfileSet([
+        ActionSet(players[idx], [
+            Action(players[idx], value=from_json_value(value), label=label) for (value, label) in actions
+        ])
+        for (idx, actions) in description["action_sets"]
+    ])
+    return CompiledGame(I, S, A, arrays["mu"], arrays["P"], arrays["R"], description["delta"],
+                        joint_action_table=arrays.get("joint_actions"))
+
+
+def save_compiled_game(game: typing.Union[StochasticGame, CompiledGame, AnonymousGame], path: pathlib.Path):
+    # a directory holding the players, states and action sets as JSON and every table as a .npy file, so that
+    # load_compiled_game can memory-map the tables; the transition sampler is saved along if it was built
+    if isinstance(game, StochasticGame):
+        game = compile_game(game)
+    path = pathlib.Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    meta = game_description(game)
+    for (name, array) in game_arrays(game).items():
+        np.save(path / f"{name}.npy", array)
+    meta["sampler"] = game.P_sparse is not None
+    if game.P_sparse is not None:
+        for name in SAMPLER_ARRAYS:
+            np.save(path / f"sampler_{name}.npy", getattr(game.P_sparse, name))
+    with open(path / GAME_META_FILE, "w") as f:
+        json.dump(meta, f)
+    return path
+
+
+def load_compiled_game(path: pathlib.Path, mmap_mode: typing.Optional[str] = "r"):
+    # the game saved by save_compiled_game, its tables memory-mapped (read-only by default) unless mmap_mode is None
+    path = pathlib.Path(path)
+    with open(path / GAME_META_FILE) as f:
+        meta = json.load(f)
+    # games saved before their joint action table was saved along rebuild it
+    game = game_from_description(meta, {
+        name: np.load(path / f"{name}.npy", mmap_mode=mmap_mode)
+        for name in GAME_ARRAYS + (JOINT_ACTION_TABLES[meta["kind"]], ) if (path / f"{name}.npy").exists()
+    })
+    if meta["sampler"]:
+        (indptr, indices, data, cum) = (
+            np.load(path / f"sampler_{name}.npy", mmap_mode=mmap_mode) for name in SAMPLER_ARRAYS
+        )
+        game.P_sparse = SparseTransitionKernel(game.n_states, game.n_joint_actions, indptr, indices, data, cum=cum)
+    return game
+
+
+__all__ = ["game_description", "game_arrays", "game_from_description", "save_compiled_game", "load_compiled_game"]
@@ -2,7 +2,6 @@ import math
 import numbers
 import typing
 import pathlib
-import statistics
 
 import numpy as np
 import matplotlib.pyplot as plt
@@ -10,6 +9,9 @@ import matplotlib.pyplot as plt
 from framework.game import *
 from framework.q_learning import *
 from framework.utils import *
+from framework.compiled import *
+from framework.anonymous import *
+from framework.recording import *
 
 
 plt.rcParams.update({
@@ -19,6 +21,8 @@ plt.rcParams.update({
 })
 LARGE_FONTDICT = {"fontsize": 26}
 PLOT_SPACING = 1000
+BEST_RESPONSE_TOL = 1e-12  # sup-norm change at which the value iteration shown in the auxiliary plot stops
+PLOT_CHUNK_SIZE = 256  # checkpoints read at a time, so that on-disk histories larger than memory can be streamed
 
 
 def plot_on_time_logscale(quantities: typing.Dict[str, typing.Tuple[typing.List[numbers.Number]]],
@@ -50,33 +54,77 @@ def plot_on_time_logscale(quantities: typing.Dict[str, typing.Tuple[typing.List[
     plt.close()
 
 
-def plot_policy_convergence_l1(games: typing.List[StochasticGame], pi_histories: typing.List[typing.List[JointPolicy]],
+def trial_mean_and_stdev(I: PlayerSet, times: typing.List[int], distances: np.ndarray):
+    # distances: [N_trials, len(times), N] -> per-player curves of the mean and stdev over trials
+    mean = distances.mean(axis=0)
+    stdev = distances.std(axis=0, ddof=1)
+    distances_mean = {str(i): (times, mean[:, idx].tolist()) for (idx, i) in enumerate(I)}
+    distances_stdev = {str(i): (times, stdev[:, idx].tolist()) for (idx, i) in enumerate(I)}
+    return distances_mean, distances_stdev
+
+
+def l1_distances_to_last(x, chunk_size: int = PLOT_CHUNK_SIZE):
+    # x: [N_trials, checkpoints, N, S, max|A_i|], possibly lazily loaded -> [N_trials, checkpoints - 1, N]
+    N_trials, C, N = x.shape[:3]
+    last = np.asarray(x[:, -1:], dtype=np.float64)
+    distances = np.zeros(shape=(N_trials, C - 1, N))
+    for start in range(0, C - 1, chunk_size):
+        stop = min(start + chunk_size, C - 1)
+        distances[:, start:stop] = np.abs(np.asarray(x[:, start:stop], dtype=np.float64) - last).sum(axis=(-2, -1))
+    return distances
+
+
+def policy_convergence_l1(history: LearningHistory):
+    # history.pi: [N_trials, checkpoints, N, S, max|A_i|], compared against the last checkpoint
+    return l1_distances_to_last(history.pi)
+
+
+def local_Q_convergence_l1(history: LearningHistory):
+    return l1_distances_to_last(history.q_tilde)
+
+
+def value_iteration_convergence_l1(I: PlayerSet,
+                                   value_iteration_histories: typing.List[typing.Dict[Player, typing.List[np.array]]]):
+    N_trials = len(value_iteration_histories)
+    # histories stopped early by a tolerance have converged, so they are padded with zero distance
+    T = max(len(value_iteration_histories[j][i]) for j in range(N_trials) for i in I)
+    l1_distances = np.zeros(shape=(N_trials, T, len(I)))
+    for j in range(N_trials):
+        for (idx, i) in enumerate(I):
+            V_i = np.asarray(value_iteration_histories[j][i])
+            l1_distances[j, :len(V_i), idx] = np.abs(V_i - V_i[-1]).sum(axis=-1)
+    return l1_distances
+
+
+def policy_convergence_to_nash_l1(game: typing.Union[StochasticGame, CompiledGame, AnonymousGame],
+                                  history: LearningHistory, T: int = int(1e5), tol: float = BEST_RESPONSE_TOL):
+    # the value iteration histories of each trial's best responses to the last policies (for
+    # plot_value_iteration_convergence_l1, stopped once within tol), and the distances [N_trials, checkpoints - 1, N]
+    # of the checkpoints' values to the best responses' values, which policy iteration solves exactly
+    compiled_game = compile_game(game) if isinstance(game, StochasticGame) else game
+    N_trials = history.pi.shape[0]
+    pi_opt = np.asarray(history.pi[:, -1], dtype=np.float64)
+    P_reduced, R_reduced = stacked_reduced_models(compiled_game, pi_opt)
+    vi_histories = []
+    V_opt = np.zeros(shape=(N_trials, compiled_game.n_players, compiled_game.n_states))
+    for j in range(N_trials):
+        v_opt_i_histories = dict()
+        for (idx, i) in enumerate(game.I):
+            n_i = int(compiled_game.n_actions[idx])
+            (P_i, R_i) = (P_reduced[j, idx, :, :n_i], R_reduced[j, idx, :, :n_i])
+            V_opt[j, idx], _ = solve_best_response(P_i, R_i, game.delta, T=T, method="policy_iteration")
+            _, v_opt_i_histories[i] = solve_best_response(P_i, R_i, game.delta, T=T, tol=tol, record_history=True)
+        vi_histories.append(v_opt_i_histories)
+    l1_distances = nash_gap_l1(P_reduced, R_reduced, V_opt, history.pi, game.delta, chunk_size=PLOT_CHUNK_SIZE)[:, :-1]
+    return vi_histories, l1_distances
+
+
+def plot_policy_convergence_l1(games: typing.List[StochasticGame], history: LearningHistory,
                                result_dir: pathlib.Path):
-    N_trials = len(games)
-    K = len(pi_histories[0])
     game = games[0]
-    I = game.I
-    S = game.S
-    A = game.A
-    l1_distances_mean = dict()
-    l1_distances_stdev = dict()
-    for i in I:
-        l1_distances_mean_i = []
-        l1_distances_stdev_i = []
-        times_i = []
-        for k in range(0, K, K // PLOT_SPACING):
-            l1_distances_ik = []
-            for j in range(N_trials):
-                pi_i_K = pi_histories[j][-1][i]
-                pi_i_k = pi_histories[j][k][i]
-                l1_distance = sum(abs(pi_i_k[(s, a_i)] - pi_i_K[(s, a_i)]) for s in S for a_i in A[i])
-                l1_distances_ik.append(l1_distance)
-            times_i.append(k)
-            l1_distances_mean_i.append(statistics.mean(l1_distances_ik))
-            l1_distances_stdev_i.append(statistics.stdev(l1_distances_ik))
-
-        l1_distances_mean[str(i)] = (times_i, l1_distances_mean_i)
-        l1_distances_stdev[str(i)] = (times_i, l1_distances_stdev_i)
+    times = history.steps[:-1].tolist()
+    l1_distances = policy_convergence_l1(history)
+    l1_distances_mean, l1_distances_stdev = trial_mean_and_stdev(game.I, times, l1_distances)
 
     plot_on_time_logscale(
         quantities=l1_distances_mean, stdevs=l1_distances_stdev,
@@ -85,33 +133,12 @@ def plot_policy_convergence_l1(games: typing.List[StochasticGame], pi_histories:
     )
 
 
-def plot_local_Q_convergence_l1(games: typing.List[StochasticGame],
-                                q_tilde_histories: typing.List[typing.List[JointPolicy]],
+def plot_local_Q_convergence_l1(games: typing.List[StochasticGame], history: LearningHistory,
                                 result_dir: pathlib.Path):
-    N_trials = len(games)
-    K = len(q_tilde_histories[0])
     game = games[0]
-    I = game.I
-    S = game.S
-    A = game.A
-    l1_distances_mean = dict()
-    l1_distances_stdev = dict()
-    for i in I:
-        l1_distances_mean_i = []
-        l1_distances_stdev_i = []
-        times_i = []
-        for k in range(0, K, K // PLOT_SPACING):
-            l1_distances_ik = []
-            for j in range(N_trials):
-                q_tilde_i_K = q_tilde_histories[j][-1][i]
-                q_tilde_i_k = q_tilde_histories[j][k][i]
-                l1_distance = sum(abs(q_tilde_i_k[(s, a_i)] - q_tilde_i_K[(s, a_i)]) for s in S for a_i in A[i])
-                l1_distances_ik.append(l1_distance)
-            times_i.append(k)
-            l1_distances_mean_i.append(statistics.mean(l1_distances_ik))
-            l1_distances_stdev_i.append(statistics.stdev(l1_distances_ik))
-        l1_distances_mean[str(i)] = (times_i, l1_distances_mean_i)
-        l1_distances_stdev[str(i)] = (times_i, l1_distances_stdev_i)
+    times = history.steps[:-1].tolist()
+    l1_distances = local_Q_convergence_l1(history)
+    l1_distances_mean, l1_distances_stdev = trial_mean_and_stdev(game.I, times, l1_distances)
     plot_on_time_logscale(
         quantities=l1_distances_mean, stdevs=l1_distances_stdev,
         title="$\|\\tilde{q}_{i}^{k} - \\tilde{q}_{i}^{K}\|_{1}$", xlabel="$k$",
@@ -122,76 +149,21 @@ def plot_local_Q_convergence_l1(games: typing.List[StochasticGame],
 def plot_value_iteration_convergence_l1(games: typing.List[StochasticGame],
                                         value_iteration_histories: typing.List[typing.Dict[Player, typing.List[np.array]]],
                                         result_dir: pathlib.Path):
-    N_trials = len(games)
-    T = len(value_iteration_histories[0])
-    game = games[0]
-    I = game.I
-    l1_distances_mean = dict()
-    l1_distances_stdev = dict()
-    for i in I:
-        l1_distances_mean_i = []
-        l1_distances_stdev_i = []
-        times_i = []
-        for t in range(T):
-            l1_distances_ik = []
-            for j in range(N_trials):
-                V_i_T = value_iteration_histories[j][i][-1]
-                V_i_t = value_iteration_histories[j][i][t]
-                l1_distances_ik.append(np.linalg.norm(V_i_T - V_i_t, ord=1))
-            times_i.append(t)
-            l1_distances_mean_i.append(statistics.mean(l1_distances_ik))
-            l1_distances_stdev_i.append(statistics.stdev(l1_distances_ik))
-        l1_distances_mean[str(i)] = (times_i, l1_distances_mean_i)
-        l1_distances_stdev[str(i)] = (times_i, l1_distances_stdev_i)
+    I = games[0].I
+    l1_distances = value_iteration_convergence_l1(I, value_iteration_histories)
+    l1_distances_mean, l1_distances_stdev = trial_mean_and_stdev(I, list(range(l1_distances.shape[1])), l1_distances)
     plot_on_time_logscale(quantities=l1_distances_mean, stdevs=l1_distances_stdev,
                           title="Value iteration convergence", xlabel="$t$",
                           file=result_dir / "aux_VI_convergence.jpg")
 
 
-def plot_policy_convergence_to_nash_l1(games: typing.List[StochasticGame], pi_histories: typing.List[typing.List[JointPolicy]],
+def plot_policy_convergence_to_nash_l1(games: typing.List[StochasticGame], history: LearningHistory,
                                        result_dir: pathlib.Path):
-    N_trials = len(games)
-    K = len(pi_histories[0])
     game = games[0]
-    I = game.I
-    S = game.S
-    A = game.A
-    P = game.P
-    R = game.R
-    delta = game.delta
-    T = int(1e5)
-    S_list = list(S)
-    vi_histories = []
-    for j in range(N_trials):
-        v_opt_i_histories = dict()
-        pi_opt = pi_histories[j][-1]
-        for i in I:
-            v_opt_i_history = value_iteration(i, pi_opt.minus(i), game.P, game.R, S_list, A, game.delta, T)
-            v_opt_i_histories[i] = v_opt_i_history
-        vi_histories.append(v_opt_i_histories)
+    vi_histories, l1_distances = policy_convergence_to_nash_l1(game, history)
     plot_value_iteration_convergence_l1(games, vi_histories, result_dir)
-    l1_distances_mean = dict()
-    l1_distances_stdev = dict()
-    for i in I:
-        l1_distances_mean_i = []
-        l1_distances_stdev_i = []
-        times_i = []
-        for k in range(0, K, K // PLOT_SPACING):
-            l1_distances_ik = []
-            for j in range(N_trials):
-                V_opt_i = vi_histories[j][i][-1]
-                pi_opt = pi_histories[j][-1]
-                pi_k = pi_histories[j][k]
-                P_pi = construct_P_pi(i, pi_k[i], pi_opt.minus(i), P, S_list, A)
-                r_pi = construct_r_pi(i, pi_k[i], pi_opt.minus(i), R, S_list, A)
-                V_k_i = np.linalg.inv(np.eye(len(S_list)) - delta * P_pi) @ r_pi
-                l1_distance = np.linalg.norm(V_k_i - V_opt_i, ord=1)
-                l1_distances_ik.append(l1_distance)
-            times_i.append(k)
-            l1_distances_mean_i.append(statistics.mean(l1_distances_ik))
-            l1_distances_stdev_i.append(statistics.stdev(l1_distances_ik))
-        l1_distances_mean[str(i)] = (times_i, l1_distances_mean_i)
-        l1_distances_stdev[str(i)] = (times_i, l1_distances_stdev_i)
+    times = history.steps[:-1].tolist()
+    l1_distances_mean, l1_distances_stdev = trial_mean_and_stdev(game.I, times, l1_distances)
     plot_on_time_logscale(quantities=l1_distances_mean, stdevs=l1_distances_stdev,
                           title="$\|V_{i}(\pi_{i}^{k}, \pi_{-i}^{K}) - V_{i}(\pi_{i}^{\star}, \pi_{-i}^{K})\|_{1}$",
                           xlabel="$k$", file=result_dir / "nash_l1.jpg", include_yticks=True)
@@ -1,27 +1,37 @@
 import typing
-import itertools
+
+import numpy as np
 
 from .game import *
+from .game import stack_arrays
 
 
 class LocalQFunction:
+    # Q_i[s, a_i] is stored in array[state index, action index]; the (s, a_i) keys are kept for compatibility
     def __init__(self, states: StateSet, actions: ActionSet,
-                 initialization_q_fn: typing.Callable[[State, Action], float]):
+                 initialization_q_fn: typing.Optional[typing.Callable[[State, Action], float]] = None,
+                 array: typing.Optional[np.ndarray] = None):
         self.states: StateSet = states
         self.actions: ActionSet = actions
-        self.kernel: typing.Dict[typing.Tuple[State, Action], float] = {
-            (s, a_i): initialization_q_fn(s, a_i)
-            for (s, a_i) in itertools.product(self.states, self.actions)
-        }
+        if array is None:
+            array = np.array([[initialization_q_fn(s, a_i) for a_i in actions] for s in states], dtype=np.float64)
+        self.array: np.ndarray = array.reshape(len(states), len(actions))  # [|S|, |A_i|]
+
+    @property
+    def kernel(self):
+        return KernelView(self, self.states, self.actions)
 
     def __getitem__(self, item):
-        return self.kernel[item]
+        (s, a_i) = item
+        return float(self.array[self.states.index(s), self.actions.index(a_i)])
 
     def __setitem__(self, key, value):
-        self.kernel[key] = value
+        (s, a_i) = key
+        self.array[self.states.index(s), self.actions.index(a_i)] = value
 
     def __eq__(self, other):
-        return isinstance(other, LocalQFunction) and self.kernel == other.kernel
+        return isinstance(other, LocalQFunction) and self.states == other.states and self.actions == other.actions \
+            and np.array_equal(self.array, other.array)
 
     def __repr__(self):
         return repr(self.kernel)
@@ -29,19 +39,24 @@ class LocalQFunction:
     def expected_value(self, state: State, action_or_policy: typing.Union[Action, Policy]):
         if isinstance(action_or_policy, Action):
             a_i = action_or_policy
-            return self.kernel[(state, a_i)]
+            return self[(state, a_i)]
 
         elif isinstance(action_or_policy, Policy):
             pi_i = action_or_policy
-            return sum(
-                self.kernel[(state, a_i)] * pi_i[(state, a_i)]
-                for a_i in pi_i.actions
-            )
+            j = self.states.index(state)
+            return float(self.array[j] @ pi_i.array[pi_i.joint_states.index(state)])
 
 
 class JointLocalQFunction:
+    # the players' Q functions share one buffer, array[player, state index, action index]; like policies, a Q
+    # function belongs to one joint Q function at a time (see stack_arrays)
     def __init__(self, player_q_fn_map: typing.Dict[Player, LocalQFunction]):
         self.player_q_fn_map = player_q_fn_map
+        self.array: np.ndarray = stack_arrays(player_q_fn_map)
+
+    def __reduce__(self):
+        # copies and unpickled instances stack their (copied) Q functions again
+        return JointLocalQFunction, (self.player_q_fn_map, )
 
     def __getitem__(self, item):
         return self.player_q_fn_map[item]
@@ -54,31 +69,44 @@ class JointLocalQFunction:
 
 
 class QFunction:
+    # Q_i[s, a] is stored in array[state index, joint action index]
     def __init__(self, states: StateSet, action_profiles: ActionProfileSet,
-                 initialization_q_fn: typing.Callable[[State, ActionProfile], float]):
+                 initialization_q_fn: typing.Optional[typing.Callable[[State, ActionProfile], float]] = None,
+                 array: typing.Optional[np.ndarray] = None):
         self.states: StateSet = states
         self.action_profiles: ActionProfileSet = action_profiles
-        self.kernel: typing.Dict[typing.Tuple[State, ActionProfile], float] = {
-            (s, a): initialization_q_fn(s, a)
-            for (s, a) in itertools.product(self.states, self.action_profiles)
-        }
+        if array is None:
+            array = np.array([[initialization_q_fn(s, a) for a in action_profiles] for s in states], dtype=np.float64)
+        self.array: np.ndarray = array.reshape(len(states), action_profiles.size)  # [|S|, |A|]
+
+    @property
+    def kernel(self):
+        return KernelView(self, self.states, self.action_profiles)
 
     def __getitem__(self, item):
-        return self.kernel[item]
+        (s, a) = item
+        return float(self.array[self.states.index(s), self.action_profiles.index(a)])
 
     def __setitem__(self, key, value):
-        self.kernel[key] = value
+        (s, a) = key
+        self.array[self.states.index(s), self.action_profiles.index(a)] = value
 
     def __eq__(self, other):
-        return isinstance(other, QFunction) and self.kernel == other.kernel
+        return isinstance(other, QFunction) and self.states == other.states \
+            and self.action_profiles == other.action_profiles and np.array_equal(self.array, other.array)
 
     def __repr__(self):
         return repr(self.kernel)
 
 
 class JointQFunction:
+    # the players' Q functions share one buffer, array[player, state index, joint action index]
     def __init__(self, player_q_fn_map: typing.Dict[Player, QFunction]):
         self.player_q_fn_map = player_q_fn_map
+        self.array: np.ndarray = stack_arrays(player_q_fn_map)
+
+    def __reduce__(self):
+        return JointQFunction, (self.player_q_fn_map, )
 
     def __getitem__(self, item):
         return self.player_q_fn_map[item]
@@ -91,27 +119,40 @@ class JointQFunction:
 
 
 class VFunction:
+    # V_i[s] is stored in array[state index]
     def __init__(self, states: StateSet,
-                 initialization_v_fn: typing.Callable[[State], float]):
+                 initialization_v_fn: typing.Optional[typing.Callable[[State], float]] = None,
+                 array: typing.Optional[np.ndarray] = None):
         self.states = states
-        self.kernel = {s: initialization_v_fn(s) for s in self.states}
+        if array is None:
+            array = np.array([initialization_v_fn(s) for s in states], dtype=np.float64)
+        self.array: np.ndarray = array.reshape(len(states))  # [|S|]
+
+    @property
+    def kernel(self):
+        return KernelView(self, self.states)
 
     def __getitem__(self, item):
-        return self.kernel[item]
+        return float(self.array[self.states.index(item)])
 
     def __setitem__(self, key, value):
-        self.kernel[key] = value
+        self.array[self.states.index(key)] = value
 
     def __eq__(self, other):
-        return isinstance(other, VFunction) and self.kernel == other.kernel
+        return isinstance(other, VFunction) and self.states == other.states and np.array_equal(self.array, other.array)
 
     def __repr__(self):
         return repr(self.kernel)
 
 
 class JointVFunction:
+    # the players' value functions share one buffer, array[player, state index]
     def __init__(self, player_v_fn_map: typing.Dict[Player, VFunction]):
         self.player_v_fn_map = player_v_fn_map
+        self.array: np.ndarray = stack_arrays(player_v_fn_map)
+
+    def __reduce__(self):
+        return JointVFunction, (self.player_v_fn_map, )
 
     def __getitem__(self, item):
         return self.player_v_fn_map[item]
@@ -0,0 +1,193 @@
+import abc
+import typing
+
+import numpy as np
+
+
+def compact_int_dtype(n: int):
+    # smallest unsigned integer type holding the indices 0, ..., n - 1
+    return np.min_scalar_type(max(n - 1, 0))
+
+
+def clipped_steps(steps, K: int):
+    # the sorted distinct steps among 0, ..., K - 1, with steps out of range moved to the nearest end
+    return np.unique(np.clip(np.asarray(steps, dtype=np.int64), 0, K - 1)) if K > 0 else np.zeros(0, dtype=np.int64)
+
+
+class RecordingSchedule(abc.ABC):
+    @abc.abstractmethod
+    def indices(self, K: int) -> np.ndarray:
+        pass
+
+
+class EveryNSteps(RecordingSchedule):
+    def __init__(self, n: int = 1):
+        assert n >= 1
+        self.n: int = n
+
+    def __repr__(self):
+        return f"EveryNSteps({self.n})"
+
+    def indices(self, K: int):
+        return clipped_steps(np.append(np.arange(0, K, self.n), K - 1), K)
+
+
+class LogSpacedSteps(RecordingSchedule):
+    def __init__(self, n_points: int = 1000):
+        assert n_points >= 2
+        self.n_points: int = n_points
+
+    def __repr__(self):
+        return f"LogSpacedSteps({self.n_points})"
+
+    def indices(self, K: int):
+        steps = np.geomspace(1, max(K - 1, 1), num=self.n_points).astype(np.int64)
+        return clipped_steps(np.append(steps, [0, K - 1]), K)
+
+
+class CustomSteps(RecordingSchedule):
+    def __init__(self, steps: typing.Iterable[int]):
+        self.steps: np.ndarray = np.unique(np.asarray(list(steps), dtype=np.int64))
+
+    def __repr__(self):
+        return f"CustomSteps({self.steps.tolist()})"
+
+    def indices(self, K: int):
+        assert len(self.steps) == 0 or (self.steps[0] >= 0 and self.steps[-1] < K)
+        return self.steps
+
+
+class LearningHistory:
+    def __init__(self, steps: np.ndarray, pi: np.ndarray, q_tilde: np.ndarray,
+                 s: typing.Optional[np.ndarray], a: typing.Optional[np.ndarray]):
+        self.steps: np.ndarray = steps  # iterations k at which pi^k, q_tilde^k were recorded
+        self.pi: np.ndarray = pi  # [..., len(steps), N, S, max|A_i|]
+        self.q_tilde: np.ndarray = q_tilde  # [..., len(steps), N, S, max|A_i|]
+        self.s: typing.Optional[np.ndarray] = s  # [..., K] state indices
+        self.a: typing.Optional[np.ndarray] = a  # [..., K, N] per-player action indices
+
+    def __repr__(self):
+        return f"LearningHistory(steps={len(self.steps)}, pi={self.pi.shape}, q_tilde={self.q_tilde.shape})"
+
+    @staticmethod
+    def allocate(B: int, K: int, steps: np.ndarray, n_players: int, n_states: int, max_actions: int,
+                 record_trajectory: bool = True):
+        shape = (B, len(steps), n_players, n_states, max_actions)
+        return LearningHistory(
+            steps=steps,
+            pi=np.zeros(shape=shape),
+            q_tilde=np.zeros(shape=shape),
+            s=np.zeros(shape=(B, K), dtype=compact_int_dtype(n_states)) if record_trajectory else None,
+            a=np.zeros(shape=(B, K, n_players), dtype=compact_int_dtype(max_actions)) if record_trajectory else None,
+        )
+
+    def record_checkpoint(self, c: int, k: int, pi: np.ndarray, q_tilde: np.ndarray,
+                          N: np.ndarray, N_tilde: np.ndarray):
+        self.pi[:, c] = pi
+        self.q_tilde[:, c] = q_tilde
+
+    def record_step(self, k: int, s_k: np.ndarray, a_k: np.ndarray):
+        if self.s is not None:
+            self.s[:, k] = s_k
+            self.a[:, k] = a_k
+
+    def record_steps(self, k: int, s_block: np.ndarray, a_block: np.ndarray):
+        # steps k, ..., k + T - 1 from [B, T] states and [B, T, N] actions
+        if self.s is not None:
+            self.s[:, k:k + s_block.shape[1]] = s_block
+            self.a[:, k:k + s_block.shape[1]] = a_block
+
+    def lane(self, b: int):
+        return LearningHistory(
+            steps=self.steps, pi=self.pi[b], q_tilde=self.q_tilde[b],
+            s=None if self.s is None else self.s[b],
+            a=None if self.a is None else self.a[b],
+        )
+
+
+class DeltaHistory:
+    def __init__(self, keyframe_interval: int, pi_keyframes: np.ndarray, q_tilde_keyframes: np.ndarray,
+                 s: np.ndarray, a: np.ndarray, pi_rows: np.ndarray, q_tilde_values: np.ndarray):
+        self.keyframe_interval: int = keyframe_interval
+        self.pi_keyframes: np.ndarray = pi_keyframes  # [B, K // keyframe_interval + 1, N, S, max|A_i|]
+        self.q_tilde_keyframes: np.ndarray = q_tilde_keyframes  # [B, K // keyframe_interval + 1, N, S, max|A_i|]
+        self.s: np.ndarray = s  # [B, K] state s_k updated at step k
+        self.a: np.ndarray = a  # [B, K, N] actions a_k, i.e. the q_tilde entries updated at step k
+        self.pi_rows: np.ndarray = pi_rows  # [B, K, N, max|A_i|] rows pi^{k+1}[:, s_k, :]
+        self.q_tilde_values: np.ndarray = q_tilde_values  # [B, K, N] entries q_tilde^{k+1}[i, s_k, a_k[i]]
+
+    def __repr__(self):
+        return f"DeltaHistory(K={self.K}, keyframe_interval={self.keyframe_interval}, lanes={self.s.shape[0]})"
+
+    @property
+    def K(self):
+        return self.s.shape[-1]
+
+    @staticmethod
+    def allocate(B: int, K: int, keyframe_interval: int, n_players: int, n_states: int, max_actions: int):
+        assert keyframe_interval >= 1
+        keyframe_shape = (B, K // keyframe_interval + 1, n_players, n_states, max_actions)
+        return DeltaHistory(
+            keyframe_interval=keyframe_interval,
+            pi_keyframes=np.zeros(shape=keyframe_shape),
+            q_tilde_keyframes=np.zeros(shape=keyframe_shape),
+            s=np.zeros(shape=(B, K), dtype=compact_int_dtype(n_states)),
+            a=np.zeros(shape=(B, K, n_players), dtype=compact_int_dtype(max_actions)),
+            pi_rows=np.zeros(shape=(B, K, n_players, max_actions)),
+            q_tilde_values=np.zeros(shape=(B, K, n_players)),
+        )
+
+    def lane(self, b: int):
+        # keeps a lane axis of length 1, which replay relies on
+        return DeltaHistory(
+            keyframe_interval=self.keyframe_interval,
+            pi_keyframes=self.pi_keyframes[b:b + 1], q_tilde_keyframes=self.q_tilde_keyframes[b:b + 1],
+            s=self.s[b:b + 1], a=self.a[b:b + 1],
+            pi_rows=self.pi_rows[b:b + 1], q_tilde_values=self.q_tilde_values[b:b + 1],
+        )
+
+    def replay(self, pi: np.ndarray, q_tilde: np.ndarray, start: int, stop: int):
+        # apply the deltas of steps start, ..., stop - 1 in place
+        lanes = np.arange(self.s.shape[0])[:, None]
+        players = np.arange(self.a.shape[-1])[None, :]
+        for t in range(start, stop):
+            s_t = self.s[:, t, None].astype(np.int64)
+            pi[lanes, players, s_t] = self.pi_rows[:, t]
+            q_tilde[lanes, players, s_t, self.a[:, t]] = self.q_tilde_values[:, t]
+
+    def reconstruct(self, k: int):
+        # (pi^k, q_tilde^k), the iterates before step k, for any 0 <= k <= K
+        assert 0 <= k <= self.K
+        f = k // self.keyframe_interval
+        pi = self.pi_keyframes[:, f].copy()
+        q_tilde = self.q_tilde_keyframes[:, f].copy()
+        self.replay(pi, q_tilde, f * self.keyframe_interval, k)
+        return pi, q_tilde
+
+    def checkpoints(self, schedule: RecordingSchedule):
+        # replays forward once, seeking to a keyframe only when it is closer than the previous checkpoint
+        steps = schedule.indices(self.K)
+        B, _, n_players, n_states, max_actions = self.pi_keyframes.shape
+        history = LearningHistory(
+            steps=steps,
+            pi=np.zeros(shape=(B, len(steps), n_players, n_states, max_actions)),
+            q_tilde=np.zeros(shape=(B, len(steps), n_players, n_states, max_actions)),
+            s=self.s, a=self.a,
+        )
+        pi, q_tilde, k = None, None, None
+        for (c, step) in enumerate(steps):
+            f = step // self.keyframe_interval
+            if k is None or k > step or k < f * self.keyframe_interval:
+                pi, q_tilde = self.pi_keyframes[:, f].copy(), self.q_tilde_keyframes[:, f].copy()
+                k = f * self.keyframe_interval
+            self.replay(pi, q_tilde, k, step)
+            k = step
+            history.pi[:, c] = pi
+            history.q_tilde[:, c] = q_tilde
+        return history
+
+
+__all__ = [
+    "compact_int_dtype", "RecordingSchedule", "EveryNSteps", "LogSpacedSteps", "CustomSteps", "LearningHistory",
+    "DeltaHistory"
+]
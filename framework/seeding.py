@@ -0,0 +1,34 @@
+import random
+import typing
+
+import numpy as np
+
+
+def python_rng(seed_sequence: np.random.SeedSequence):
+    return random.Random(int(seed_sequence.generate_state(1, dtype=np.uint64)[0]))
+
+
+class TrialStreams:
+    # independent streams of one trial: one per player for its actions and one for the environment
+    # (initial state and transitions), all derived from the trial's SeedSequence
+    def __init__(self, seed_sequence: np.random.SeedSequence, n_players: int):
+        self.seed_sequence: np.random.SeedSequence = seed_sequence
+        (environment, *players) = seed_sequence.spawn(n_players + 1)
+        self.players: typing.List[random.Random] = [python_rng(player) for player in players]
+        self.environment: random.Random = python_rng(environment)
+
+    def __repr__(self):
+        return f"TrialStreams(entropy={self.seed_sequence.entropy}, spawn_key={self.seed_sequence.spawn_key}, " \
+               f"players={len(self.players)})"
+
+    def player_rngs(self, I: typing.Iterable):
+        # {player: stream} for JointPolicy.sample_joint_action, in the order of the player set
+        return {i: rng for (i, rng) in zip(I, self.players)}
+
+
+def spawn_trial_streams(seed: int, n_trials: int, n_players: int):
+    # trial j's streams depend only on (seed, j), so trials can run in any process and order
+    return [TrialStreams(seed_sequence, n_players) for seed_sequence in np.random.SeedSequence(seed).spawn(n_trials)]
+
+
+__all__ = ["python_rng", "TrialStreams", "spawn_trial_streams"]
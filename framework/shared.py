@@ -0,0 +1,106 @@
+import copy
+import multiprocessing.shared_memory
+import typing
+
+import numpy as np
+
+from .compiled import *
+from .anonymous import *
+from .sparse import *
+from .persistence import *
+
+
+class SharedArray:
+    # picklable reference to an array published in a shared memory block
+    def __init__(self, name: str, shape: typing.Tuple[int, ...], dtype: np.dtype):
+        self.name: str = name
+        self.shape: typing.Tuple[int, ...] = tuple(shape)
+        self.dtype: np.dtype = np.dtype(dtype)
+
+    def __repr__(self):
+        return f"SharedArray({self.name}, shape={self.shape}, dtype={self.dtype})"
+
+    @staticmethod
+    def publish(array: np.ndarray):
+        block = multiprocessing.shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        return SharedArray(block.name, array.shape, array.dtype), block
+
+    def attach(self):
+        # meant for child processes of the publisher: they share its resource tracker, which therefore
+        # tracks the block once and leaves unlinking it to the publisher
+        block = multiprocessing.shared_memory.SharedMemory(name=self.name)
+        array = np.ndarray(self.shape, dtype=self.dtype, buffer=block.buf)
+        array.flags.writeable = False
+        return array, block
+
+
+# games attached in this process, by the name of their first block, with the blocks backing them
+ATTACHED_GAMES: typing.Dict[str, typing.Tuple[typing.Union[CompiledGame, AnonymousGame],
+                                              typing.List[multiprocessing.shared_memory.SharedMemory]]] = dict()
+
+
+class SharedGame:
+    # publishes the tables of a compiled game and the arrays of its transition sampler once; the handle pickles to
+    # the game's description (see game_description) and references to the arrays, so that other processes attach
+    # read-only views and rebuild the players, states and action sets once each, whatever the number of joint actions
+    def __init__(self, game: typing.Union[CompiledGame, AnonymousGame]):
+        self.blocks: typing.List[multiprocessing.shared_memory.SharedMemory] = []
+        sampler = game.transition_sampler()
+        self.description: typing.Dict[str, typing.Any] = game_description(game)
+        self.game_arrays: typing.Dict[str, SharedArray] = self.publish(game_arrays(game))
+        self.sampler: SparseTransitionKernel = copy.copy(sampler)
+        self.sampler_arrays: typing.Dict[str, SharedArray] = self.publish({
+            name: value for (name, value) in vars(sampler).items() if isinstance(value, np.ndarray)
+        })
+        for name in self.sampler_arrays:
+            setattr(self.sampler, name, None)
+        self.sampler.alias_probability, self.sampler.alias_index = None, None
+
+    def __repr__(self):
+        return f"SharedGame({self.description['kind']}, blocks={[array.name for array in self.game_arrays.values()]})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["blocks"] = []
+        return state
+
+    def publish(self, arrays: typing.Dict[str, np.ndarray]):
+        shared_arrays = dict()
+        for (name, array) in arrays.items():
+            (shared_arrays[name], block) = SharedArray.publish(np.asarray(array))
+            self.blocks.append(block)
+        return shared_arrays
+
+    def attach(self):
+        key = next(iter(self.game_arrays.values())).name
+        if key not in ATTACHED_GAMES:
+            blocks = []
+            arrays = dict()
+            for (name, shared_array) in self.game_arrays.items():
+                (arrays[name], block) = shared_array.attach()
+                blocks.append(block)
+            game = game_from_description(self.description, arrays)
+            sampler = copy.copy(self.sampler)
+            for (name, shared_array) in self.sampler_arrays.items():
+                (array, block) = shared_array.attach()
+                setattr(sampler, name, array)
+                blocks.append(block)
+            game.P_sparse = sampler
+            ATTACHED_GAMES[key] = (game, blocks)
+        return ATTACHED_GAMES[key][0]
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+__all__ = ["SharedArray", "SharedGame"]
@@ -0,0 +1,123 @@
+import typing
+
+import numpy as np
+
+from .game import *
+
+
+class SparseTransitionKernel:
+    # CSR storage of P[s, a, s'] with one row per (s, a) (row index s * |A| + a) holding its nonzero next states
+    def __init__(self, n_states: int, n_joint_actions: int, indptr: np.ndarray, indices: np.ndarray, data: np.ndarray,
+                 cum: np.ndarray = None):
+        self.n_states: int = n_states
+        self.n_joint_actions: int = n_joint_actions
+        self.indptr: np.ndarray = np.asarray(indptr, dtype=np.int64)  # [S * |A| + 1]
+        self.indices: np.ndarray = np.asarray(indices, dtype=np.int64)  # [nnz] next states, increasing within a row
+        self.data: np.ndarray = np.asarray(data, dtype=np.float64)  # [nnz] probabilities
+        assert self.indptr.shape == (n_states * n_joint_actions + 1, )
+        assert self.indices.shape == self.data.shape
+
+        self.row_nnz: np.ndarray = np.diff(self.indptr)
+        self.max_row_nnz: int = int(self.row_nnz.max()) if len(self.row_nnz) > 0 else 0
+        # cumulative weights within each row, accumulated left to right like random.choices (unless given); the
+        # rows are padded with zeros to a common width, which leaves the sums of their entries unchanged
+        if cum is None:
+            (rows, columns) = self.entry_positions()
+            padded = np.zeros(shape=(len(self.row_nnz), self.max_row_nnz))
+            padded[rows, columns] = self.data
+            cum = np.cumsum(padded, axis=1)[rows, columns]
+        self.cum: np.ndarray = np.asarray(cum, dtype=np.float64)
+        assert self.cum.shape == self.data.shape
+        self.row_totals: np.ndarray = np.where(self.row_nnz > 0, self.cum[np.maximum(self.indptr[1:] - 1, 0)], 0.0)
+        self.alias_probability: typing.Optional[np.ndarray] = None
+        self.alias_index: typing.Optional[np.ndarray] = None
+
+    def __repr__(self):
+        return f"SparseTransitionKernel(S={self.n_states}, A={self.n_joint_actions}, nnz={self.nnz})"
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    def entry_positions(self):
+        # (row, position within the row) of every entry
+        rows = np.repeat(np.arange(len(self.row_nnz)), self.row_nnz)
+        return rows, np.arange(self.nnz) - self.indptr[rows]
+
+    @staticmethod
+    def from_dense(P: np.ndarray):
+        (n_states, n_joint_actions, _) = P.shape
+        rows = P.reshape(n_states * n_joint_actions, n_states)
+        (row, indices) = np.nonzero(rows)
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(row, minlength=len(rows)))])
+        return SparseTransitionKernel(n_states, n_joint_actions, indptr, indices, rows[row, indices])
+
+    @staticmethod
+    def from_kernel(kernel: typing.Union[ProbabilityTransitionKernel, FactoredTransitionKernel]):
+        # only the nonzero entries of the kernel dict are kept
+        (S, A) = (kernel.state_set, kernel.joint_action_set)
+        entries = sorted(
+            (S.index(s) * A.size + A.index(a), S.index(s_prime), pr)
+            for ((s, a, s_prime), pr) in kernel.kernel.items() if pr != 0.0
+        )
+        row = np.array([entry[0] for entry in entries], dtype=np.int64)
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(row, minlength=len(S) * A.size))])
+        return SparseTransitionKernel(len(S), A.size, indptr,
+                                      [entry[1] for entry in entries], [entry[2] for entry in entries])
+
+    def todense(self):
+        P = np.zeros(shape=(self.n_states * self.n_joint_actions, self.n_states))
+        P[np.repeat(np.arange(len(self.row_nnz)), self.row_nnz), self.indices] = self.data
+        return P.reshape(self.n_states, self.n_joint_actions, self.n_states)
+
+    def row(self, s: np.ndarray, a: np.ndarray):
+        return np.asarray(s, dtype=np.int64) * self.n_joint_actions + np.asarray(a, dtype=np.int64)
+
+    def sample(self, s: np.ndarray, a: np.ndarray, u: np.ndarray):
+        # next states for a batch of (s, a) pairs and uniforms u in [0, 1), by bisection of the cumulative weights;
+        # picks the same next state as random.choices over all S states would for the same uniform
+        row = self.row(s, a)
+        start = self.indptr[row]
+        positions = np.arange(self.max_row_nnz)
+        entries = np.minimum(start[..., None] + positions, self.nnz - 1)
+        x = np.asarray(u) * self.row_totals[row]
+        k = ((self.cum[entries] <= x[..., None]) & (positions < self.row_nnz[row][..., None])).sum(axis=-1)
+        return self.indices[start + np.minimum(k, self.row_nnz[row] - 1)]
+
+    def build_alias_tables(self):
+        # Vose's alias method, one table per row stored alongside the CSR entries; all rows are built at once, each
+        # pass settling one underfull entry of every row that still has one, so at most max_row_nnz passes are needed
+        (rows, columns) = self.entry_positions()
+        shape = (len(self.row_nnz), self.max_row_nnz)
+        scaled = np.zeros(shape=shape)
+        scaled[rows, columns] = self.data * self.row_nnz[rows] / self.row_totals[rows]
+        pending = np.zeros(shape=shape, dtype=bool)
+        pending[rows, columns] = True
+        probability = np.ones(shape=shape)
+        alias = np.broadcast_to(np.arange(self.max_row_nnz), shape).copy()
+        for _ in range(self.max_row_nnz):
+            (small, large) = (pending & (scaled < 1.0), pending & (scaled >= 1.0))
+            active = np.flatnonzero(small.any(axis=1) & large.any(axis=1))
+            if len(active) == 0:
+                break
+            (j_small, j_large) = (small[active].argmax(axis=1), large[active].argmax(axis=1))
+            probability[active, j_small] = scaled[active, j_small]
+            alias[active, j_small] = j_large
+            scaled[active, j_large] -= 1.0 - scaled[active, j_small]
+            pending[active, j_small] = False
+        self.alias_probability = probability[rows, columns]
+        self.alias_index = self.indptr[rows] + alias[rows, columns]
+
+    def sample_alias(self, s: np.ndarray, a: np.ndarray, u: np.ndarray):
+        # O(1) next states for a batch of (s, a) pairs, one uniform each
+        if self.alias_probability is None:
+            self.build_alias_tables()
+        row = self.row(s, a)
+        scaled = np.asarray(u) * self.row_nnz[row]
+        column = np.minimum(scaled.astype(np.int64), self.row_nnz[row] - 1)
+        entry = self.indptr[row] + column
+        entry = np.where(scaled - column < self.alias_probability[entry], entry, self.alias_index[entry])
+        return self.indices[entry]
+
+
+__all__ = ["SparseTransitionKernel"]
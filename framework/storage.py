@@ -0,0 +1,234 @@
+import json
+import pathlib
+import typing
+
+import numpy as np
+
+from .recording import *
+
+
+META_FILE = "meta.json"
+
+
+class ColumnWriter:
+    def __init__(self, path: pathlib.Path, name: str, row_shape: typing.Tuple[int, ...], dtype: np.dtype,
+                 chunk_size: int, compress: bool):
+        self.path: pathlib.Path = path
+        self.name: str = name
+        self.row_shape: typing.Tuple[int, ...] = tuple(row_shape)
+        self.dtype: np.dtype = np.dtype(dtype)
+        self.chunk_size: int = chunk_size
+        self.compress: bool = compress
+        self.buffer: np.ndarray = np.zeros(shape=(chunk_size, ) + self.row_shape, dtype=self.dtype)
+        self.fill: int = 0
+        self.n_rows: int = 0
+        self.n_chunks: int = 0
+        if self.compress:
+            (self.path / self.name).mkdir(parents=True, exist_ok=True)
+            self.file = None
+        else:
+            self.file = open(self.path / f"{self.name}.bin", "wb")
+
+    def append(self, row):
+        self.buffer[self.fill] = row
+        self.fill += 1
+        if self.fill == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.fill == 0:
+            return
+        if self.compress:
+            np.savez_compressed(self.path / self.name / f"chunk_{self.n_chunks:06d}.npz", rows=self.buffer[:self.fill])
+        else:
+            self.file.write(self.buffer[:self.fill].tobytes())
+        self.n_rows += self.fill
+        self.n_chunks += 1
+        self.fill = 0
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def meta(self):
+        return {"dtype": self.dtype.str, "row_shape": list(self.row_shape), "n_rows": self.n_rows}
+
+
+class TrajectoryWriter:
+    def __init__(self, path: pathlib.Path, chunk_size: int = 4096, float32: bool = False, compress: bool = False):
+        self.path: pathlib.Path = pathlib.Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.chunk_size: int = chunk_size
+        self.float32: bool = float32  # downcast float64 columns
+        self.compress: bool = compress  # compressed chunk files instead of one memory-mappable file per column
+        self.columns: typing.Dict[str, ColumnWriter] = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def append(self, name: str, row):
+        row = np.asarray(row)
+        if name not in self.columns:
+            dtype = np.float32 if (self.float32 and row.dtype == np.float64) else row.dtype
+            self.columns[name] = ColumnWriter(self.path, name, row.shape, dtype, self.chunk_size, self.compress)
+        self.columns[name].append(row)
+
+    def record_checkpoint(self, c: int, k: int, pi: np.ndarray, q_tilde: np.ndarray,
+                          N: np.ndarray, N_tilde: np.ndarray):
+        self.append("steps", k)
+        self.append("pi", pi)
+        self.append("q_tilde", q_tilde)
+        self.append("N", N)
+        self.append("N_tilde", N_tilde)
+
+    def record_step(self, k: int, s_k: np.ndarray, a_k: np.ndarray):
+        self.append("s", s_k)
+        self.append("a", a_k)
+
+    def record_steps(self, k: int, s_block: np.ndarray, a_block: np.ndarray):
+        for t in range(s_block.shape[1]):
+            self.record_step(k + t, s_block[:, t], a_block[:, t])
+
+    def close(self):
+        for column in self.columns.values():
+            column.close()
+        meta = {
+            "chunk_size": self.chunk_size,
+            "compress": self.compress,
+            "columns": {name: column.meta() for (name, column) in self.columns.items()},
+        }
+        with open(self.path / META_FILE, "w") as f:
+            json.dump(meta, f, indent=2)
+
+
+class Column:
+    def __init__(self, path: pathlib.Path, name: str, dtype: str, row_shape: typing.List[int], n_rows: int,
+                 chunk_size: int, compress: bool):
+        self.path: pathlib.Path = path
+        self.name: str = name
+        self.dtype: np.dtype = np.dtype(dtype)
+        self.row_shape: typing.Tuple[int, ...] = tuple(row_shape)
+        self.n_rows: int = n_rows
+        self.chunk_size: int = chunk_size
+        self.compress: bool = compress
+        self.memmap: typing.Optional[np.memmap] = None
+        self.cached_chunk: typing.Tuple[int, typing.Optional[np.ndarray]] = (-1, None)
+        if not self.compress and self.n_rows > 0:
+            self.memmap = np.memmap(self.path / f"{self.name}.bin", dtype=self.dtype, mode="r",
+                                    shape=(self.n_rows, ) + self.row_shape)
+
+    def __len__(self):
+        return self.n_rows
+
+    def __repr__(self):
+        return f"Column({self.name}, rows={self.n_rows}, row_shape={self.row_shape}, dtype={self.dtype})"
+
+    @property
+    def shape(self):
+        return (self.n_rows, ) + self.row_shape
+
+    def chunk(self, c: int):
+        if self.cached_chunk[0] != c:
+            with np.load(self.path / self.name / f"chunk_{c:06d}.npz") as f:
+                self.cached_chunk = (c, f["rows"])
+        return self.cached_chunk[1]
+
+    def rows(self, start: int, stop: int):
+        if self.memmap is not None:
+            return self.memmap[start:stop]
+        if start >= stop:
+            return np.zeros(shape=(0, ) + self.row_shape, dtype=self.dtype)
+        parts = []
+        for c in range(start // self.chunk_size, (stop - 1) // self.chunk_size + 1):
+            offset = c * self.chunk_size
+            parts.append(self.chunk(c)[max(start - offset, 0):stop - offset])
+        return np.concatenate(parts, axis=0)
+
+    def chunks(self):
+        for start in range(0, self.n_rows, self.chunk_size):
+            yield start, self.rows(start, min(start + self.chunk_size, self.n_rows))
+
+    def __getitem__(self, item):
+        if isinstance(item, tuple):
+            return self[item[0]][(slice(None), ) + item[1:] if isinstance(item[0], slice) else item[1:]]
+        if isinstance(item, slice):
+            (start, stop, step) = item.indices(self.n_rows)
+            if step < 0:
+                return self.rows(stop + 1, start + 1)[::step]
+            return self.rows(start, stop)[::step]
+        item = range(self.n_rows)[item]
+        return self.rows(item, item + 1)[0]
+
+
+class LaneMajorColumn:
+    # presents a time-major column of [B, ...] rows as a lazily loaded [B, T, ...] array, or [T, ...] for one lane
+    def __init__(self, column: Column, lane: int = None):
+        self.column: Column = column
+        self.lane: typing.Optional[int] = lane
+
+    @property
+    def shape(self):
+        shape = (self.column.row_shape[0], self.column.n_rows) + self.column.row_shape[1:]
+        return shape if self.lane is None else shape[1:]
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self[:], dtype=dtype)
+
+    def __getitem__(self, item):
+        item = item if isinstance(item, tuple) else (item, )
+        if self.lane is None and len(item) == 1 and isinstance(item[0], (int, np.integer)):
+            return LaneMajorColumn(self.column, lane=int(item[0]))
+        if self.lane is not None:
+            item = (self.lane, ) + item
+        lane_item = item[0]
+        time_item = item[1] if len(item) > 1 else slice(None)
+        if isinstance(time_item, slice):
+            return np.moveaxis(np.asarray(self.column[time_item]), 0, 1)[(lane_item, slice(None)) + item[2:]]
+        return np.asarray(self.column[time_item])[(lane_item, ) + item[2:]]
+
+
+class TrajectoryStore:
+    def __init__(self, path: pathlib.Path):
+        self.path: pathlib.Path = pathlib.Path(path)
+        with open(self.path / META_FILE) as f:
+            meta = json.load(f)
+        self.chunk_size: int = meta["chunk_size"]
+        self.compress: bool = meta["compress"]
+        self.columns: typing.Dict[str, Column] = {
+            name: Column(self.path, name, column["dtype"], column["row_shape"], column["n_rows"],
+                         self.chunk_size, self.compress)
+            for (name, column) in meta["columns"].items()
+        }
+
+    def __getitem__(self, item):
+        return self.columns[item]
+
+    def __contains__(self, item):
+        return item in self.columns
+
+    def __repr__(self):
+        return f"TrajectoryStore({self.path}, {list(self.columns.values())})"
+
+    def history(self):
+        return LearningHistory(
+            steps=np.asarray(self.columns["steps"][:]),
+            pi=LaneMajorColumn(self.columns["pi"]),
+            q_tilde=LaneMajorColumn(self.columns["q_tilde"]),
+            s=LaneMajorColumn(self.columns["s"]) if "s" in self.columns else None,
+            a=LaneMajorColumn(self.columns["a"]) if "a" in self.columns else None,
+        )
+
+
+__all__ = ["ColumnWriter", "TrajectoryWriter", "Column", "LaneMajorColumn", "TrajectoryStore"]
@@ -1,86 +1,206 @@
-import copy
 import typing
+import weakref
 
 import numpy as np
 
 from framework.game import *
+from framework.compiled import *
+from framework.anonymous import *
 
 
 def indicator(x: bool):
     return 1.0 if x else 0.0
 
 
+# tables of transition kernels and reward functions, kept while the kernel or reward function lives, so that calls
+# of construct_P_pi, construct_r_pi and value_iteration for every player and checkpoint tabulate them once
+TRANSITION_TABLES: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+REWARD_TABLES: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def transition_table(P: typing.Union[ProbabilityTransitionKernel, FactoredTransitionKernel],
+                     S_list: typing.List[State], A: ActionProfileSet):
+    # P [S, |A|, S] with states in the order of S_list
+    (cached_S_list, cached_A, table) = TRANSITION_TABLES.get(P, (None, None, None))
+    if cached_S_list != S_list or cached_A is not A:
+        S = StateSet(S_list)
+        table = np.zeros(shape=(len(S_list), A.size, len(S_list)))
+        for ((s, a, s_prime), pr) in P.kernel.items():
+            table[S.index(s), A.index(a), S.index(s_prime)] = pr
+        TRANSITION_TABLES[P] = (list(S_list), A, table)
+    return table
+
+
+def reward_table(R: RewardFunction, players: typing.List[Player], S_list: typing.List[State], A: ActionProfileSet):
+    # R [N, S, |A|] for the given players, with states in the order of S_list
+    (cached_players, cached_S_list, cached_A, table) = REWARD_TABLES.get(R, (None, None, None, None))
+    if cached_players != players or cached_S_list != S_list or cached_A is not A:
+        S = StateSet(S_list)
+        table = np.zeros(shape=(len(players), len(S_list), A.size))
+        for (idx, i) in enumerate(players):
+            for ((s, a), r) in R.kernel[i].items():
+                table[idx, S.index(s), A.index(a)] = r
+        REWARD_TABLES[R] = (list(players), list(S_list), A, table)
+    return table
+
+
+def player_model(i: Player, pi_minus_i: JointPolicy, P: typing.Optional[ProbabilityTransitionKernel],
+                 R: typing.Optional[RewardFunction], S_list: typing.List[State], A: ActionProfileSet,
+                 pi_i: typing.Optional[Policy] = None):
+    # the compiled game of P and R, player i's index in it and the policy array [N, S, max|A_i|] of pi_minus_i,
+    # and of pi_i if given (player i's rows are uniform otherwise); whichever of P and R is None is left as a
+    # read-only view of a single zero, which costs nothing as long as it is not contracted
+    players = [action_set.player for action_set in A.action_sets]
+    S = StateSet(S_list)
+    P_table = np.broadcast_to(0.0, (len(S), A.size, len(S))) if P is None else transition_table(P, S_list, A)
+    R_table = np.broadcast_to(0.0, (len(players), len(S), A.size)) if R is None else reward_table(R, players, S_list, A)
+    game = CompiledGame(PlayerSet(players), S, A, np.full(len(S_list), 1 / len(S_list)), P_table, R_table, 0.0)
+    policies = dict(pi_minus_i.player_policy_map)
+    policies[i] = pi_i if pi_i is not None else Policy(S, A[i], lambda s, a_i: 1 / len(A[i]))
+    return game, game.player_index[i], game.policy_array(JointPolicy(policies, stack=False))
+
+
 def construct_P_pi(
         i: Player, pi_i: Policy, pi_minus_i: JointPolicy, P: ProbabilityTransitionKernel,
         S_list: typing.List[State], A: ActionProfileSet
 ):
-    P_pi = np.zeros(shape=(len(S_list), len(S_list)))
-    for j1 in range(len(S_list)):
-        for j2 in range(len(S_list)):
-            P_pi[j1, j2] = sum(
-                P[(S_list[j1], a, S_list[j2])]
-                * pi_i[(S_list[j1], a[i])]
-                * pi_minus_i.prob(S_list[j1], a.minus(i))
-                for a in A
-            )
-    return P_pi
+    (game, idx, pi) = player_model(i, pi_minus_i, P, None, S_list, A, pi_i=pi_i)
+    return induced_transitions(reduced_transitions(game, idx, pi), pi[idx])
 
 
 def construct_r_pi(
         i: Player, pi_i: Policy, pi_minus_i: JointPolicy, R: RewardFunction,
         S_list: typing.List[State], A: ActionProfileSet
 ):
-    r = np.zeros(len(S_list))
-    for j in range(len(S_list)):
-        r[j] = sum(
-            R.get_reward(i, S_list[j], a)
-            * pi_i[(S_list[j], a[i])]
-            * pi_minus_i.prob(S_list[j], a.minus(i))
-            for a in A
-        )
-    return r
+    (game, idx, pi) = player_model(i, pi_minus_i, None, R, S_list, A, pi_i=pi_i)
+    return induced_rewards(reduced_rewards(game, idx, pi), pi[idx])
 
 
 def value_iteration(i: Player, pi_minus_i: JointPolicy, P: ProbabilityTransitionKernel, R: RewardFunction,
-                    S_list: typing.List[State], A: ActionProfileSet, delta: float, T: int = int(1e5)):
-    Ai_list = list(A[i])
-
-    P_reduced = np.zeros(shape=(len(S_list), len(Ai_list), len(S_list)))
-    for j1 in range(len(S_list)):
-        for j2 in range(len(Ai_list)):
-            for j3 in range(len(S_list)):
-                P_reduced[j1, j2, j3] = sum(
-                    P[(S_list[j1], ActionProfile.merge(Ai_list[j2], a_minus_i), S_list[j3])]
-                    * pi_minus_i.prob(S_list[j1], a_minus_i)
-                    for a_minus_i in A.minus(i)
-                )
-
-    R_reduced = np.zeros(shape=(len(S_list), len(Ai_list)))
-    for j1 in range(len(S_list)):
-        for j2 in range(len(A[i])):
-            R_reduced[j1, j2] = sum(
-                R.get_reward(i, S_list[j1], ActionProfile.merge(Ai_list[j2], a_minus_i))
-                * pi_minus_i.prob(S_list[j1], a_minus_i)
-                for a_minus_i in A.minus(i)
-            )
-
-    V_opt_i = np.zeros(shape=(len(S_list), ))
-    V_opt_i_history = []
-
-    for _ in range(T):
-        new_V_opt_i = copy.deepcopy(V_opt_i)
-        for j1 in range(len(S_list)):
-            new_V_opt_i[j1] = max(
-                R_reduced[j1, j2] + delta * sum(
-                    P_reduced[j1, j2, j3]
-                    * V_opt_i[j3]
-                    for j3 in range(len(S_list))
-                )
-                for j2 in range(len(Ai_list))
-            )
-        V_opt_i_history.append(V_opt_i)
-        V_opt_i = new_V_opt_i
-    return V_opt_i_history
-
-
-__all__ = ["indicator", "construct_P_pi", "construct_r_pi", "value_iteration"]
+                    S_list: typing.List[State], A: ActionProfileSet, delta: float, T: int = int(1e5),
+                    tol: float = None, method: str = "value_iteration", record_history: bool = True):
+    (game, idx, pi) = player_model(i, pi_minus_i, P, R, S_list, A)
+    P_reduced, R_reduced = reduced_model(game, idx, pi)
+    V_opt_i, V_opt_i_history = solve_best_response(P_reduced, R_reduced, delta, T=T, tol=tol, method=method,
+                                                   record_history=record_history)
+    return V_opt_i_history if record_history else [V_opt_i]
+
+
+def solve_best_response(P_reduced: np.ndarray, R_reduced: np.ndarray, delta: float, T: int = int(1e5),
+                        tol: float = None, method: str = "value_iteration", record_history: bool = False):
+    # P_reduced: [S, |A_i|, S], R_reduced: [S, |A_i|]; returns the optimal V and, if asked, the iterates before it
+    S = R_reduced.shape[0]
+    V = np.zeros(shape=(S, ))
+    V_history = []
+    if method == "value_iteration":
+        for _ in range(T):
+            new_V = (R_reduced + delta * (P_reduced @ V)).max(axis=-1)
+            if record_history:
+                V_history.append(V)
+            converged = tol is not None and np.max(np.abs(new_V - V)) <= tol
+            V = new_V
+            if converged:
+                break
+    elif method == "policy_iteration":
+        policy = None
+        for _ in range(T):
+            if record_history:
+                V_history.append(V)
+            new_policy = (R_reduced + delta * (P_reduced @ V)).argmax(axis=-1)
+            if policy is not None and np.array_equal(new_policy, policy):
+                break
+            policy = new_policy
+            P_policy = P_reduced[np.arange(S), policy]
+            R_policy = R_reduced[np.arange(S), policy]
+            V = np.linalg.solve(np.eye(S) - delta * P_policy, R_policy)
+    else:
+        raise ValueError(f"unknown method {method}")
+    return V, V_history
+
+
+def contract_players(game: CompiledGame, X: np.ndarray, pi: np.ndarray, players: typing.Iterable[int]):
+    # X: [S, |A|, ...] indexed by joint action; sums out the action of each listed player against
+    # pi[player, s, :], one player axis at a time -> [S, remaining players' action axes, ...]
+    S = X.shape[0]
+    X = X.reshape((S, ) + game.joint_action_shape + X.shape[2:])
+    for idx in sorted(players, key=lambda idx: -game.player_axes[idx]):
+        axis = 1 + int(game.player_axes[idx])
+        n_i = int(game.n_actions[idx])
+        weights_shape = [S] + [1] * (X.ndim - 1)
+        weights_shape[axis] = n_i
+        X = (X * pi[idx, :, :n_i].reshape(weights_shape)).sum(axis=axis)
+    return X
+
+
+def reduced_model(game: typing.Union[CompiledGame, AnonymousGame], i: int, pi: np.ndarray):
+    # player i's model against the other players' policies in pi [N, S, max|A_i|]:
+    # P_reduced [S, |A_i|, S], R_reduced [S, |A_i|]
+    if isinstance(game, AnonymousGame):
+        return game.reduced_model(i, pi)
+    return reduced_transitions(game, i, pi), reduced_rewards(game, i, pi)
+
+
+def reduced_transitions(game: CompiledGame, i: int, pi: np.ndarray):
+    return contract_players(game, game.P, pi, [idx for idx in range(game.n_players) if idx != i])
+
+
+def reduced_rewards(game: CompiledGame, i: int, pi: np.ndarray):
+    return contract_players(game, game.R[i], pi, [idx for idx in range(game.n_players) if idx != i])
+
+
+def induced_model(P_reduced: np.ndarray, R_reduced: np.ndarray, pi_i: np.ndarray):
+    # P_pi [..., S, S], r_pi [..., S] when player i plays pi_i [..., S, max|A_i|] in the reduced model
+    return induced_transitions(P_reduced, pi_i), induced_rewards(R_reduced, pi_i)
+
+
+def induced_transitions(P_reduced: np.ndarray, pi_i: np.ndarray):
+    return np.einsum("...sa,sat->...st", pi_i[..., :P_reduced.shape[-2]], P_reduced)
+
+
+def induced_rewards(R_reduced: np.ndarray, pi_i: np.ndarray):
+    return (pi_i[..., :R_reduced.shape[-1]] * R_reduced).sum(axis=-1)
+
+
+def stacked_reduced_models(game: typing.Union[CompiledGame, AnonymousGame], pi: np.ndarray):
+    # every player's reduced model against pi [B, N, S, max|A_i|], padded to max|A_i| actions:
+    # P_reduced [B, N, S, max|A_i|, S], R_reduced [B, N, S, max|A_i|]
+    B = pi.shape[0]
+    P_reduced = np.zeros(shape=(B, game.n_players, game.n_states, game.max_actions, game.n_states))
+    R_reduced = np.zeros(shape=(B, game.n_players, game.n_states, game.max_actions))
+    for b in range(B):
+        for idx in range(game.n_players):
+            n_i = int(game.n_actions[idx])
+            P_reduced[b, idx, :, :n_i], R_reduced[b, idx, :, :n_i] = reduced_model(game, idx, pi[b])
+    return P_reduced, R_reduced
+
+
+def evaluate_policies(P_pi: np.ndarray, r_pi: np.ndarray, delta: float):
+    # V = (I - delta P_pi)^{-1} r_pi for a stack of systems P_pi [..., S, S], r_pi [..., S]
+    S = P_pi.shape[-1]
+    return np.linalg.solve(np.eye(S) - delta * P_pi, r_pi[..., None])[..., 0]
+
+
+def nash_gap_l1(P_reduced: np.ndarray, R_reduced: np.ndarray, V_opt: np.ndarray, pi_checkpoints, delta: float,
+                chunk_size: int = 256):
+    # ||V_i(pi_i^k, pi_-i) - V_i^*||_1 for pi_checkpoints [B, C, N, S, max|A_i|] (possibly lazily loaded),
+    # against the stacked reduced models of stacked_reduced_models and V_opt [B, N, S] -> [B, C, N];
+    # all (trial, checkpoint, player) systems of a chunk of checkpoints are solved in one call
+    B, C = pi_checkpoints.shape[:2]
+    N = P_reduced.shape[1]
+    gaps = np.zeros(shape=(B, C, N))
+    for start in range(0, C, chunk_size):
+        stop = min(start + chunk_size, C)
+        pi_k = np.asarray(pi_checkpoints[:, start:stop], dtype=np.float64)
+        P_pi = np.einsum("bcnsa,bnsat->bcnst", pi_k, P_reduced)
+        r_pi = np.einsum("bcnsa,bnsa->bcns", pi_k, R_reduced)
+        V_k = evaluate_policies(P_pi, r_pi, delta)
+        gaps[:, start:stop] = np.abs(V_k - V_opt[:, None]).sum(axis=-1)
+    return gaps
+
+
+__all__ = [
+    "indicator", "construct_P_pi", "construct_r_pi", "value_iteration", "solve_best_response",
+    "contract_players", "reduced_model", "reduced_transitions", "reduced_rewards", "induced_model",
+    "induced_transitions", "induced_rewards",
+    "stacked_reduced_models", "evaluate_policies", "nash_gap_l1"
+]
@@ -1,11 +1,22 @@
 import copy
 import math
+import random
 import typing
+import warnings
 
+import numpy as np
 import tqdm
 
 from framework.game import *
 from framework.q_learning import *
+from framework.compiled import *
+from framework.anonymous import *
+from framework.recording import *
+from framework.storage import *
+from framework.hooks import *
+from framework.sparse import *
+from framework.seeding import *
+from framework.kernels import *
 
 
 def xlogx(x):
@@ -15,10 +26,20 @@ def xlogx(x):
         return x * math.log(x)
 
 
+def elementwise(fn: typing.Callable[[float], float], x: np.ndarray):
+    # math.exp/math.log rather than their numpy counterparts, which round differently
+    return np.fromiter(map(fn, x.ravel().tolist()), dtype=np.float64, count=x.size).reshape(x.shape)
+
+
+def sequential_sum(x: np.ndarray):
+    # left-to-right summation over the last axis, as the builtin sum does
+    return np.cumsum(x, axis=-1)[..., -1]
+
+
 def independent_decentralized_algo(game: StochasticGame, K: int,
                                    alpha: typing.Callable[[int], float] = lambda n: 1 / (n ** 0.5),
                                    beta: typing.Callable[[int], float] = lambda n: 1 / n,
-                                   tau: float = 0.000001
+                                   tau: float = 0.000001, streams: TrialStreams = None
                                    ):
     I = game.I  # player set
     S = game.S  # state set
@@ -40,7 +61,11 @@ def independent_decentralized_algo(game: StochasticGame, K: int,
     pi = JointPolicy(pi)
     q_tilde = JointLocalQFunction(q_tilde)
 
-    s_k = mu.sample_initial_state()
+    # without streams everything is drawn from the global random module
+    environment_rng = streams.environment if streams is not None else random
+    player_rngs = streams.player_rngs(I) if streams is not None else random
+
+    s_k = mu.sample_initial_state(environment_rng)
 
     pi_history = []
     q_tilde_history = []
@@ -49,13 +74,13 @@ def independent_decentralized_algo(game: StochasticGame, K: int,
 
     for k in tqdm.tqdm(range(K)):
         # sample action, update state, collect reward
-        a_k = pi.sample_joint_action(s_k)
+        a_k = pi.sample_joint_action(s_k, player_rngs)
 
         N[s_k] += 1
         for i in I:
             N_tilde[i][(s_k, a_k[i])] += 1
 
-        s_k_plus_1 = P.sample_next_state(s_k, a_k)
+        s_k_plus_1 = P.sample_next_state(s_k, a_k, environment_rng)
 
         # update beliefs, policies, Q functions
         new_pi = copy.deepcopy(pi)
@@ -92,3 +117,306 @@ def independent_decentralized_algo(game: StochasticGame, K: int,
         s_k = s_k_plus_1
 
     return pi_history, q_tilde_history, s_history, a_history
+
+
+BACKENDS = ("numpy", "jit")
+JIT_BLOCK_STEPS = 65536  # steps run by one call of the compiled loop, bounding the pre-drawn uniforms
+
+
+def per_lane(value, B: int):
+    if isinstance(value, (list, tuple)):
+        assert len(value) == B
+        return list(value)
+    return [value] * B
+
+
+class BatchedIndependentDecentralizedLearner:
+    def __init__(self, game: typing.Union[CompiledGame, AnonymousGame], B: int,
+                 alpha: typing.Union[typing.Callable[[int], float], typing.List[typing.Callable[[int], float]]] = lambda n: 1 / (n ** 0.5),
+                 beta: typing.Union[typing.Callable[[int], float], typing.List[typing.Callable[[int], float]]] = lambda n: 1 / n,
+                 tau: typing.Union[float, typing.List[float]] = 0.000001, rngs: typing.List = None,
+                 generator: np.random.Generator = None, backend: str = "numpy"):
+        assert backend in BACKENDS
+        if backend == "jit" and not JIT_AVAILABLE:
+            warnings.warn("numba is not installed, falling back to the numpy backend")
+            backend = "numpy"
+        self.backend: str = backend  # "jit" runs blocks of steps in a compiled loop that matches step() exactly
+        self.game: typing.Union[CompiledGame, AnonymousGame] = game
+        self.B: int = B  # number of independent trials (lanes) advanced together
+        self.alphas = per_lane(alpha, B)
+        self.betas = per_lane(beta, B)
+        self.tau: np.ndarray = np.array(per_lane(tau, B), dtype=np.float64)
+        self.rngs = rngs if rngs is not None else [random.Random(b + 1) for b in range(B)]
+        assert len(self.rngs) == B  # anything exposing random(), e.g. the random module or a random.Random
+        # a lane's stream is shared by its players and environment unless it is a TrialStreams
+        self.player_rngs = [
+            rng.players if isinstance(rng, TrialStreams) else [rng] * game.n_players for rng in self.rngs
+        ]
+        self.environment_rngs = [rng.environment if isinstance(rng, TrialStreams) else rng for rng in self.rngs]
+        # with a generator, all lanes' uniforms come from it in one call per draw instead of from rngs
+        self.generator: typing.Optional[np.random.Generator] = generator
+
+        self.lanes: np.ndarray = np.arange(B)
+        self.players: np.ndarray = np.arange(game.n_players)
+        self.P_sparse: SparseTransitionKernel = game.transition_sampler()
+        self.mu_cum: np.ndarray = np.cumsum(game.mu)
+
+        shape = (B, game.n_players, game.n_states, game.max_actions)
+        self.N: np.ndarray = np.zeros(shape=(B, game.n_states), dtype=np.int64)  # number of times visited state
+        self.N_tilde: np.ndarray = np.zeros(shape=shape, dtype=np.int64)
+        self.pi: np.ndarray = np.broadcast_to(game.uniform_policy(), shape).copy()  # policies
+        self.q_tilde: np.ndarray = np.zeros(shape=shape)  # local Q functions
+        self.reward_sum: np.ndarray = np.zeros(shape=(B, game.n_players))  # rewards collected so far
+        self.s: np.ndarray = self.sample_indices(self.mu_cum, self.draw_environment())
+        # alpha(n), beta(n) per lane for the jit backend, extended as the counts n grow
+        self.alpha_tables: np.ndarray = np.zeros(shape=(B, 1))
+        self.beta_tables: np.ndarray = np.zeros(shape=(B, 1))
+
+    def draw_players(self):
+        # [B, N] uniforms, player by player in the order random.choices would draw them
+        if self.generator is not None:
+            return self.generator.random(size=(self.B, self.game.n_players))
+        return np.array([[rng.random() for rng in rngs] for rngs in self.player_rngs]).reshape(self.B, -1)
+
+    def draw_environment(self):
+        # [B] uniforms for the initial state or the next state
+        if self.generator is not None:
+            return self.generator.random(size=self.B)
+        return np.array([rng.random() for rng in self.environment_rngs])
+
+    @staticmethod
+    def sample_indices(cum_weights: np.ndarray, x: np.ndarray):
+        # same draw as random.choices(population, weights) along the last axis for uniforms x
+        x = x * cum_weights[..., -1]
+        return np.minimum((cum_weights <= x[..., None]).sum(axis=-1), cum_weights.shape[-1] - 1)
+
+    def draw_block(self, T: int):
+        # uniforms of T steps, ([T, B, N], [T, B]), in the order T calls of step() would draw them,
+        # assuming lanes do not share a stream
+        n_players = self.game.n_players
+        if self.generator is not None:
+            u = self.generator.random(size=(T, self.B * (n_players + 1)))
+            return u[:, :self.B * n_players].reshape(T, self.B, n_players), u[:, self.B * n_players:]
+        u = np.array([
+            [[rng.random() for rng in player_rngs] + [environment_rng.random()] for _ in range(T)]
+            for (player_rngs, environment_rng) in zip(self.player_rngs, self.environment_rngs)
+        ]).reshape(self.B, T, n_players + 1).transpose(1, 0, 2)
+        return u[:, :, :n_players], u[:, :, n_players]
+
+    @staticmethod
+    def extend_tables(tables: np.ndarray, fns: typing.List[typing.Callable[[int], float]], n: int):
+        # tables[b, m] = fns[b](m) for m = 1, ..., n - 1, computed once per distinct function
+        if tables.shape[1] >= n:
+            return tables
+        n = max(n, 2 * tables.shape[1])
+        extension = dict()
+        for fn in fns:
+            if id(fn) not in extension:
+                extension[id(fn)] = [fn(m) for m in range(max(tables.shape[1], 1), n)]
+        return np.concatenate([tables, np.array([extension[id(fn)] for fn in fns]).reshape(len(fns), -1)], axis=1)
+
+    def run_block(self, T: int):
+        # T steps, returning the states [B, T] and actions [B, T, N] of each step
+        if self.backend == "numpy":
+            s_block, a_block = zip(*(BatchedIndependentDecentralizedLearner.step(self) for _ in range(T)))
+            return np.stack(s_block, axis=1), np.stack(a_block, axis=1)
+        game = self.game
+        # counts after step k are at most k + 1, and N sums to the number of steps taken
+        n = int(self.N.sum(axis=-1).max()) + T + 1
+        self.alpha_tables = self.extend_tables(self.alpha_tables, self.alphas, n)
+        self.beta_tables = self.extend_tables(self.beta_tables, self.betas, n)
+        (player_uniforms, environment_uniforms) = self.draw_block(T)
+        s_block = np.zeros(shape=(self.B, T), dtype=np.int64)
+        a_block = np.zeros(shape=(self.B, T, game.n_players), dtype=np.int64)
+        # joint actions are encoded by strides, or by occupancy vectors for anonymous games
+        anonymous = isinstance(game, AnonymousGame)
+        unused = np.zeros(shape=(1, ), dtype=np.int64)
+        strides = unused if anonymous else game.strides
+        (radix, occupancy_table) = (game.radix, game.occupancy_table) if anonymous else (unused, unused)
+        P_sparse = self.P_sparse
+        learner_steps(
+            T, self.pi, self.q_tilde, self.N, self.N_tilde, self.reward_sum, self.s, s_block, a_block,
+            np.ascontiguousarray(player_uniforms), np.ascontiguousarray(environment_uniforms),
+            game.n_actions, game.action_mask, strides, anonymous, radix, occupancy_table, game.R,
+            P_sparse.indptr, P_sparse.indices, P_sparse.cum, P_sparse.row_totals, game.n_joint_actions,
+            float(game.delta), self.tau, self.alpha_tables, self.beta_tables
+        )
+        return s_block, a_block
+
+    def step(self):
+        game = self.game
+        lanes = self.lanes[:, None]
+        players = self.players[None, :]
+        s_k = self.s
+        s_k_rows = s_k[:, None]
+
+        # sample action, update state, collect reward
+        pi_s = self.pi[lanes, players, s_k_rows]  # [B, N, max|A_i|]
+        a_k = np.minimum(self.sample_indices(np.cumsum(pi_s, axis=-1), self.draw_players()), game.n_actions - 1)
+        a_k_joint = game.encode_joint_action(a_k)
+
+        self.N[self.lanes, s_k] += 1
+        self.N_tilde[lanes, players, s_k_rows, a_k] += 1
+
+        s_k_plus_1 = self.P_sparse.sample(s_k, a_k_joint, self.draw_environment())
+        s_k_plus_1_rows = s_k_plus_1[:, None]
+
+        # all players' updates are computed from the current buffers before any entry is overwritten,
+        # and only row s_k changes, so the update happens in place without copying the tables
+        q_s = self.q_tilde[lanes, players, s_k_rows]
+        q_sa = self.q_tilde[lanes, players, s_k_rows, a_k]
+        tau = self.tau[:, None]
+
+        nu = sequential_sum(elementwise(xlogx, pi_s))
+        expected_next = sequential_sum(
+            self.pi[lanes, players, s_k_plus_1_rows] * self.q_tilde[lanes, players, s_k_plus_1_rows]
+        )
+        alpha_k = np.array([
+            [alpha(n) for n in counts]
+            for (alpha, counts) in zip(self.alphas, self.N_tilde[lanes, players, s_k_rows, a_k].tolist())
+        ])
+        r_k = game.rewards(s_k, a_k, a_k_joint)
+        new_q_sa = q_sa + alpha_k * (
+            r_k - (tau * nu) + game.delta * expected_next - q_sa
+        )
+
+        q_s_masked = np.where(game.action_mask, q_s, -math.inf)
+        max_q_tilde = q_s_masked.max(axis=-1)
+        softmax_numer = elementwise(math.exp, (q_s_masked - max_q_tilde[..., None]) / tau[..., None])
+        softmax_denom = sequential_sum(softmax_numer)
+        beta_k = np.array([beta(n) for (beta, n) in zip(self.betas, self.N[self.lanes, s_k].tolist())])
+        new_pi_s = pi_s + beta_k[:, None, None] * (softmax_numer / softmax_denom[..., None] - pi_s)
+
+        self.q_tilde[lanes, players, s_k_rows, a_k] = new_q_sa
+        self.pi[lanes, players, s_k_rows] = new_pi_s
+        self.reward_sum += r_k
+
+        # transition to next state
+        self.s = s_k_plus_1
+        return s_k, a_k
+
+    def run(self, K: int, schedule: RecordingSchedule = None, record_trajectory: bool = True,
+            store: TrajectoryWriter = None, hooks: typing.List[LearnerHook] = ()):
+        # with a store, checkpoints and trajectories are streamed to disk and read back lazily;
+        # hooks see read-only views of the tables after each of their scheduled steps, so with
+        # schedule=CustomSteps([]) and record_trajectory=False nothing but the hooks' reductions is kept
+        game = self.game
+        steps = (schedule if schedule is not None else EveryNSteps(1)).indices(K)
+        recorder = store if store is not None else LearningHistory.allocate(
+            self.B, K, steps, game.n_players, game.n_states, game.max_actions, record_trajectory=record_trajectory
+        )
+        s_dtype = compact_int_dtype(game.n_states)
+        a_dtype = compact_int_dtype(game.max_actions)
+        state = LearnerState(game, self.pi, self.q_tilde, self.N, self.N_tilde, self.reward_sum)
+        hook_steps = [hook.schedule.indices(K) for hook in hooks]
+        hook_positions = [0] * len(hooks)  # next scheduled step of each hook
+        # the store is closed even if a hook or a block raises, so that the steps written so far stay readable
+        try:
+            for hook in hooks:
+                hook.on_start(K, state)
+            block_steps = JIT_BLOCK_STEPS if self.backend == "jit" else 1
+            c = 0  # next checkpoint
+            k = 0  # next step
+            with tqdm.tqdm(total=K) as progress:
+                while k < K:
+                    if c < len(steps) and steps[c] == k:
+                        recorder.record_checkpoint(c, k, self.pi, self.q_tilde, self.N, self.N_tilde)
+                        c += 1
+                    # a block of steps ends before the next checkpoint and right after the next hook step
+                    stop = min(
+                        [K, k + block_steps] + ([int(steps[c])] if c < len(steps) else []) + [
+                            int(hook_steps[h][hook_positions[h]]) + 1
+                            for h in range(len(hooks)) if hook_positions[h] < len(hook_steps[h])
+                        ]
+                    )
+                    s_block, a_block = self.run_block(stop - k)
+                    if record_trajectory:
+                        recorder.record_steps(k, s_block.astype(s_dtype), a_block.astype(a_dtype))
+                    progress.update(stop - k)
+                    k = stop
+                    if hooks:
+                        state.update(k - 1, s_block[:, -1], a_block[:, -1], self.s)
+                        for (h, hook) in enumerate(hooks):
+                            if hook_positions[h] < len(hook_steps[h]) and hook_steps[h][hook_positions[h]] == k - 1:
+                                hook.on_step(k - 1, state)
+                                hook_positions[h] += 1
+            for hook in hooks:
+                hook.on_end(K, state)
+        finally:
+            if store is not None:
+                store.close()
+        if store is not None:
+            return TrajectoryStore(store.path).history()
+        return recorder
+
+    def run_with_deltas(self, K: int, keyframe_interval: int = 1000):
+        game = self.game
+        history = DeltaHistory.allocate(self.B, K, keyframe_interval, game.n_players, game.n_states, game.max_actions)
+        lanes = self.lanes[:, None]
+        players = self.players[None, :]
+        for k in tqdm.tqdm(range(K)):
+            if k % keyframe_interval == 0:
+                history.pi_keyframes[:, k // keyframe_interval] = self.pi
+                history.q_tilde_keyframes[:, k // keyframe_interval] = self.q_tilde
+            s_k, a_k = (x[:, 0] for x in self.run_block(1))
+            history.s[:, k] = s_k
+            history.a[:, k] = a_k
+            history.pi_rows[:, k] = self.pi[lanes, players, s_k[:, None]]
+            history.q_tilde_values[:, k] = self.q_tilde[lanes, players, s_k[:, None], a_k]
+        if K % keyframe_interval == 0:
+            history.pi_keyframes[:, K // keyframe_interval] = self.pi
+            history.q_tilde_keyframes[:, K // keyframe_interval] = self.q_tilde
+        return history
+
+
+class IndependentDecentralizedLearner(BatchedIndependentDecentralizedLearner):
+    def __init__(self, game: typing.Union[CompiledGame, AnonymousGame],
+                 alpha: typing.Callable[[int], float] = lambda n: 1 / (n ** 0.5),
+                 beta: typing.Callable[[int], float] = lambda n: 1 / n,
+                 tau: float = 0.000001, rng=random, generator: np.random.Generator = None, backend: str = "numpy"):
+        super().__init__(game, 1, alpha=alpha, beta=beta, tau=tau, rngs=[rng], generator=generator, backend=backend)
+
+    def step(self):
+        s_k, a_k = super().step()
+        return s_k[0], a_k[0]
+
+    def run(self, K: int, schedule: RecordingSchedule = None, record_trajectory: bool = True,
+            store: TrajectoryWriter = None, hooks: typing.List[LearnerHook] = ()):
+        return super().run(K, schedule=schedule, record_trajectory=record_trajectory, store=store,
+                           hooks=hooks).lane(0)
+
+    def run_with_deltas(self, K: int, keyframe_interval: int = 1000):
+        return super().run_with_deltas(K, keyframe_interval=keyframe_interval).lane(0)
+
+
+def independent_decentralized_algo_vectorized(game: typing.Union[StochasticGame, CompiledGame, AnonymousGame], K: int,
+                                              alpha: typing.Callable[[int], float] = lambda n: 1 / (n ** 0.5),
+                                              beta: typing.Callable[[int], float] = lambda n: 1 / n,
+                                              tau: float = 0.000001, schedule: RecordingSchedule = None,
+                                              store: TrajectoryWriter = None, generator: np.random.Generator = None,
+                                              backend: str = "numpy"
+                                              ):
+    if isinstance(game, StochasticGame):
+        game = compile_game(game)
+    learner = IndependentDecentralizedLearner(game, alpha=alpha, beta=beta, tau=tau, generator=generator,
+                                              backend=backend)
+    return learner.run(K, schedule=schedule, store=store)
+
+
+def batched_independent_decentralized_algo(game: typing.Union[StochasticGame, CompiledGame, AnonymousGame], K: int,
+                                           seeds: typing.List[typing.Union[int, TrialStreams]],
+                                           alpha=lambda n: 1 / (n ** 0.5), beta=lambda n: 1 / n, tau=0.000001,
+                                           schedule: RecordingSchedule = None, store: TrajectoryWriter = None,
+                                           generator: np.random.Generator = None, backend: str = "numpy"):
+    # lane b reproduces a sequential run after random.seed(seeds[b]), or with the streams seeds[b] if those are
+    # TrialStreams (see spawn_trial_streams); alpha, beta and tau may be given per lane.
+    # With a generator all lanes draw from it at once, which is faster but ties each lane's run to the batch
+    if isinstance(game, StochasticGame):
+        game = compile_game(game)
+    learner = BatchedIndependentDecentralizedLearner(
+        game, len(seeds), alpha=alpha, beta=beta, tau=tau, rngs=[
+            seed if isinstance(seed, TrialStreams) else random.Random(seed) for seed in seeds
+        ],
+        generator=generator, backend=backend
+    )
+    return learner.run(K, schedule=schedule, store=store)
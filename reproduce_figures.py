@@ -1,144 +1,191 @@
+import argparse
+import pathlib
+import typing
+
 from framework.game import *
 from framework.q_learning import *
 from framework.utils import *
 from framework.plotting import *
+from framework.compiled import *
+from framework.recording import *
+from framework.storage import *
+from framework.cache import *
 from independent_decentralized_learning import *
 from routing_game import *
+from experiment_runner import *
 from utils import *
 
 
+def result_folder(N, M, U, m, b, lambda_1, lambda_2, delta, K, tau, alpha_r, beta_r, common_interest,
+                  strategy_independent, **_):
+    return create_result_folder(N, M, U, lambda_1, lambda_2, m, b, K, tau, alpha_r, beta_r,
+                                common_interest, strategy_independent)
+
+
+def plot_experiment(game, history: LearningHistory, N_trials: int, result_dir: pathlib.Path):
+    games = [game] * N_trials
+    plot_policy_convergence_l1(games, history, result_dir)
+    plot_policy_convergence_to_nash_l1(games, history, result_dir)
+    plot_local_Q_convergence_l1(games, history, result_dir)
+
+
 def experiment(N_trials, N, M, U, m, b, lambda_1, lambda_2, delta,
-               K, tau, alpha_r, beta_r, common_interest, strategy_independent):
-    games = []
-    pi_histories = []
-    q_tilde_histories = []
-    s_histories = []
-    a_histories = []
-    for j in range(N_trials):
-        game = create_routing_game(N=N, M=M, U=U, m=m, b=b, lambda_1=lambda_1, lambda_2=lambda_2, delta=delta,
-                                   common_interest=common_interest, strategy_independent_transitions=strategy_independent,
-                                   seed=j+1)
-        pi_history, q_tilde_history, s_history, a_history = independent_decentralized_algo(
-            game=game,
-            K=K,
-            tau=tau,
-            alpha=lambda n: 1/(n ** alpha_r),
-            beta=lambda n: 1/(n ** beta_r)
-        )
-        games.append(game)
-        pi_histories.append(pi_history)
-        q_tilde_histories.append(q_tilde_history)
-        s_histories.append(s_history)
-        a_histories.append(a_history)
+               K, tau, alpha_r, beta_r, common_interest, strategy_independent, anonymous=False):
+    # game construction does not depend on the seed, so one game serves every trial;
+    # the anonymous representation scales to many players; it tabulates the same game, but its tables agree with the
+    # compiled ones only up to rounding, so its learning trajectories need not match those of the compiled game
+    game = build_game(N, M, U, m, b, lambda_1, lambda_2, delta, common_interest, strategy_independent,
+                      anonymous=anonymous)
     result_dir = create_result_folder(N, M, U, lambda_1, lambda_2, m, b, K, tau, alpha_r, beta_r,
                                       common_interest, strategy_independent)
-    plot_policy_convergence_l1(games, pi_histories, result_dir)
-    plot_policy_convergence_to_nash_l1(games, pi_histories, result_dir)
-    plot_local_Q_convergence_l1(games, q_tilde_histories, result_dir)
+    # all trials run as lanes of one batched learner; lane j draws from random.Random(j+1) as trial j used to
+    history = batched_independent_decentralized_algo(
+        game=game,
+        K=K,
+        seeds=[j + 1 for j in range(N_trials)],
+        tau=tau,
+        alpha=lambda n: 1/(n ** alpha_r),
+        beta=lambda n: 1/(n ** beta_r),
+        schedule=checkpoint_schedule(K),
+        store=TrajectoryWriter(result_dir / "trajectory")
+    )
+    plot_experiment(game, history, N_trials, result_dir)
+
+
+def parallel_experiments(figures: typing.List[int], workers: int = None, retries: int = 2,
+                         cache: ResultCache = None):
+    # the trials of all figures run as separate jobs of one process pool, then each figure is plotted;
+    # with a cache, re-plotting or adding trials only runs the trials that have not finished before
+    histories = run_experiments({figure: FIGURES[figure] for figure in figures}, workers=workers, retries=retries,
+                                cache=cache)
+    for figure in figures:
+        parameters = FIGURES[figure]
+        game = load_game(parameters, cache)
+        plot_experiment(game, histories[figure], parameters["N_trials"], result_folder(**parameters))
+
+
+FIGURES = {
+    1: dict(
+        N_trials=5,
+        N=4,
+        M=2,
+        U=2,
+        m=[2, 4],
+        b=[9, 16],
+        lambda_1=0.8,
+        lambda_2=0.2,
+        delta=0.5,
+        K=int(1e5),
+        tau=1e-6,
+        alpha_r=0.5,
+        beta_r=1,
+        common_interest=True,
+        strategy_independent=False,
+    ),
+    2: dict(
+        N_trials=5,
+        N=4,
+        M=2,
+        U=2,
+        m=[2, 4],
+        b=[9, 16],
+        lambda_1=0.8,
+        lambda_2=0.2,
+        delta=0.5,
+        K=int(1e5),
+        tau=1e-6,
+        alpha_r=1,
+        beta_r=0.5,
+        common_interest=True,
+        strategy_independent=False,
+    ),
+    3: dict(
+        N_trials=5,
+        N=4,
+        M=2,
+        U=2,
+        m=[2, 4],
+        b=[9, 16],
+        lambda_1=0.8,
+        lambda_2=0.2,
+        delta=0.5,
+        K=int(1e5),
+        tau=1e-3,
+        alpha_r=0.5,
+        beta_r=1,
+        common_interest=True,
+        strategy_independent=False,
+    ),
+    4: dict(
+        N_trials=5,
+        N=8,
+        M=2,
+        U=2,
+        m=[2, 4],
+        b=[9, 16],
+        lambda_1=0.8,
+        lambda_2=0.2,
+        delta=0.5,
+        K=int(1e5),
+        tau=1e-6,
+        alpha_r=0.5,
+        beta_r=1,
+        common_interest=True,
+        strategy_independent=False,
+    ),
+    5: dict(
+        N_trials=5,
+        N=4,
+        M=2,
+        U=2,
+        m=[2, 4],
+        b=[9, 16],
+        lambda_1=0.8,
+        lambda_2=0.2,
+        delta=0.5,
+        K=int(1e5),
+        tau=1e-6,
+        alpha_r=0.5,
+        beta_r=1,
+        common_interest=False,
+        strategy_independent=True,
+    ),
+}
 
 
 def reproduce_figure_1():
-    N_trials = 5
-    N = 4
-    M = 2
-    U = 2
-    m = [2, 4]
-    b = [9, 16]
-    lambda_1 = 0.8
-    lambda_2 = 0.2
-    delta = 0.5
-    K = int(1e5)
-    tau = 1e-6
-    alpha_r = 0.5
-    beta_r = 1
-    common_interest = True
-    strategy_independent = False
-    experiment(N_trials, N, M, U, m, b, lambda_1, lambda_2, delta, K, tau, alpha_r, beta_r,
-               common_interest, strategy_independent)
+    experiment(**FIGURES[1])
 
 
 def reproduce_figure_2():
-    N_trials = 5
-    N = 4
-    M = 2
-    U = 2
-    m = [2, 4]
-    b = [9, 16]
-    lambda_1 = 0.8
-    lambda_2 = 0.2
-    delta = 0.5
-    K = int(1e5)
-    tau = 1e-6
-    alpha_r = 1
-    beta_r = 0.5
-    common_interest = True
-    strategy_independent = False
-    experiment(N_trials, N, M, U, m, b, lambda_1, lambda_2, delta, K, tau, alpha_r, beta_r,
-               common_interest, strategy_independent)
+    experiment(**FIGURES[2])
 
 
 def reproduce_figure_3():
-    N_trials = 5
-    N = 4
-    M = 2
-    U = 2
-    m = [2, 4]
-    b = [9, 16]
-    lambda_1 = 0.8
-    lambda_2 = 0.2
-    delta = 0.5
-    K = int(1e5)
-    tau = 1e-3
-    alpha_r = 0.5
-    beta_r = 1
-    common_interest = True
-    strategy_independent = False
-    experiment(N_trials, N, M, U, m, b, lambda_1, lambda_2, delta, K, tau, alpha_r, beta_r,
-               common_interest, strategy_independent)
+    experiment(**FIGURES[3])
 
 
 def reproduce_figure_4():
-    N_trials = 5
-    N = 8
-    M = 2
-    U = 2
-    m = [2, 4]
-    b = [9, 16]
-    lambda_1 = 0.8
-    lambda_2 = 0.2
-    delta = 0.5
-    K = int(1e5)
-    tau = 1e-6
-    alpha_r = 0.5
-    beta_r = 1
-    common_interest = True
-    strategy_independent = False
-    experiment(N_trials, N, M, U, m, b, lambda_1, lambda_2, delta, K, tau, alpha_r, beta_r,
-               common_interest, strategy_independent)
+    experiment(**FIGURES[4])
 
 
 def reproduce_figure_5():
-    N_trials = 5
-    N = 4
-    M = 2
-    U = 2
-    m = [2, 4]
-    b = [9, 16]
-    lambda_1 = 0.8
-    lambda_2 = 0.2
-    delta = 0.5
-    K = int(1e5)
-    tau = 1e-6
-    alpha_r = 0.5
-    beta_r = 1
-    common_interest = False
-    strategy_independent = True
-    experiment(N_trials, N, M, U, m, b, lambda_1, lambda_2, delta, K, tau, alpha_r, beta_r,
-               common_interest, strategy_independent)
-
-
-reproduce_figure_1()
-reproduce_figure_2()
-reproduce_figure_3()
-reproduce_figure_4()
-reproduce_figure_5()
+    experiment(**FIGURES[5])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--figures", type=int, nargs="+", default=sorted(FIGURES))
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, all cores by default")
+    parser.add_argument("--retries", type=int, default=2, help="resubmissions of a failed trial")
+    parser.add_argument("--serial", action="store_true", help="run each figure's trials as lanes in this process")
+    parser.add_argument("--cache-dir", type=pathlib.Path, default=EXPERIMENTS_DIR / "cache")
+    parser.add_argument("--cache-size", type=float, default=16.0, help="cache size cap in GiB")
+    parser.add_argument("--no-cache", action="store_true", help="recompute games and trials")
+    args = parser.parse_args()
+    if args.serial:
+        for figure in args.figures:
+            experiment(**FIGURES[figure])
+    else:
+        cache = None if args.no_cache else ResultCache(args.cache_dir, max_bytes=int(args.cache_size * 2 ** 30))
+        parallel_experiments(args.figures, workers=args.workers, retries=args.retries, cache=cache)
@@ -1,41 +1,80 @@
 import itertools
+import math
 import numbers
 import random
 import typing
 
+import numpy as np
+
 from framework.game import *
 from framework.utils import *
+from framework.anonymous import *
+from framework.compiled import *
 
 
-def create_routing_game(
-        N: int, M: int, U: int, m: typing.List[numbers.Number], b: typing.List[numbers.Number],
-        lambda_1: float = 0.8, lambda_2: float = 0.2, delta: float = 0.5,
-        common_interest: bool = False, strategy_independent_transitions: bool = False,
-        seed: int = 0
-):
-    if seed:
-        random.seed(seed)
-    else:
-        random.seed(100)
+SAFE_STATUS = 0
+UNSAFE_STATUS = 1
+STATUSES = (SAFE_STATUS, UNSAFE_STATUS)
+STATUS_MULTIPLIERS = (2.0, 1.0)  # multiplier of a route's congestion cost in each status
 
+
+def routing_players_and_states(N: int, M: int, U: int):
+    # the players and the states (one status per route) shared by every representation of the routing game
     assert N >= 1
     assert M >= 1
     assert U >= 1
+    I = PlayerSet([Player(idx=i, label=str(i + 1)) for i in range(N)])
+    S = StateSet([State(value=a) for a in itertools.product(STATUSES, repeat=M)])
+    return I, S
 
-    SAFE_STATUS = 0
-    UNSAFE_STATUS = 1
-    STATUSES = (SAFE_STATUS, UNSAFE_STATUS)
 
-    players = [Player(idx=i, label=str(i + 1)) for i in range(N)]
-    I = PlayerSet(players)
-    S = StateSet([State(value=a) for a in itertools.product(STATUSES, repeat=M)])
+def congestion_status(count, U: int):
+    # a route becomes unsafe once at least U players use it; count may be an array of counts
+    return np.where(np.asarray(count) >= U, UNSAFE_STATUS, SAFE_STATUS)
+
+
+def route_kernel(lambda_1: float, lambda_2: float):
+    # distribution of a route's next status over STATUSES, given its congestion status
+    return (lambda_1, 1 - lambda_1), (lambda_2, 1 - lambda_2)
+
+
+def route_tables(S: StateSet, counts: np.ndarray, U: int, m: typing.List[numbers.Number],
+                 b: typing.List[numbers.Number], lambda_1: float, lambda_2: float):
+    # for route counts [C, M] of joint actions or occupancy vectors: the reward of a player on each route [S, C, M]
+    # and the probability of each route's next status [C, S', M], as the closures of create_routing_game compute them
+    M = counts.shape[-1]
+    statuses = np.array([s.value for s in S], dtype=np.int64).reshape(len(S), M)  # [S, M]
+    multiplier = np.asarray(STATUS_MULTIPLIERS)[statuses]  # [S, M]
+    reward_routes = np.asarray(b, dtype=np.float64) - multiplier[:, None, :] * np.asarray(m, dtype=np.float64) \
+        * counts[None, :, :].astype(np.float64)
+    route_probabilities = np.asarray(route_kernel(lambda_1, lambda_2))[
+        congestion_status(counts, U)[:, None, :], statuses[None, :, :]
+    ]
+    return reward_routes, route_probabilities
+
+
+def create_routing_game(
+        N: int, M: int, U: int, m: typing.List[numbers.Number], b: typing.List[numbers.Number],
+        lambda_1: float = 0.8, lambda_2: float = 0.2, delta: float = 0.5,
+        common_interest: bool = False, strategy_independent_transitions: bool = False,
+        seed: typing.Optional[int] = None, factored_transitions: bool = False
+):
+    # building the game draws no random numbers; the global random module is only seeded on request,
+    # samplers take explicit streams (see framework.seeding)
+    if seed is not None:
+        random.seed(seed if seed else 100)
+
+    (I, S) = routing_players_and_states(N, M, U)
     A = ActionProfileSet([ActionSet(i, [Action(i, value=j) for j in range(M)]) for i in I])
+    kernel = route_kernel(lambda_1, lambda_2)
+
+    def route_count(route, a):
+        return sum(indicator(a[i].value == route) for i in I)
 
     def reward_oneplayer(i, s, a):
         route = a[i].value
-        status = s.value[route]
-        multiplier = 1.0 if status == UNSAFE_STATUS else 2.0
-        return b[route] - multiplier * m[route] * sum(indicator(a[j].value == route) for j in I)
+        multiplier = STATUS_MULTIPLIERS[s.value[route]]
+        return b[route] - multiplier * m[route] * route_count(route, a)
 
     def reward(i, s, a):
         if common_interest:
@@ -45,18 +84,8 @@ def create_routing_game(
 
     def strategy_dependent_transition_kernel(s, a, s_prime):
         pr = 1.0
-        counts_a = {route: sum(indicator(a[i].value == route) for i in I) for route in range(M)}
         for route in range(M):
-            a_status = UNSAFE_STATUS if counts_a[route] >= U else SAFE_STATUS
-            s_prime_status = s_prime.value[route]
-            if a_status == SAFE_STATUS and s_prime_status == SAFE_STATUS:
-                pr *= lambda_1
-            elif a_status == SAFE_STATUS and s_prime_status == UNSAFE_STATUS:
-                pr *= 1 - lambda_1
-            elif a_status == UNSAFE_STATUS and s_prime_status == SAFE_STATUS:
-                pr *= lambda_2
-            elif a_status == UNSAFE_STATUS and s_prime_status == UNSAFE_STATUS:
-                pr *= 1 - lambda_2
+            pr *= kernel[congestion_status(route_count(route, a), U)][s_prime.value[route]]
         return pr
 
     if strategy_independent_transitions:
@@ -72,8 +101,87 @@ def create_routing_game(
     else:
         transition_kernel = strategy_dependent_transition_kernel
 
+    def route_transition_kernel(route, s, a):
+        # distribution of the route's next status over STATUSES
+        return list(kernel[congestion_status(route_count(route, a), U)])
+
     mu = InitialStateDistribution(S, lambda s: 1 / len(S))
-    P = ProbabilityTransitionKernel(S, A, transition_kernel)
+    if factored_transitions and not strategy_independent_transitions:
+        P = FactoredTransitionKernel(S, A, [STATUSES] * M, route_transition_kernel)
+    else:
+        P = ProbabilityTransitionKernel(S, A, transition_kernel)
     R = RewardFunction(I, S, A, reward)
     game = StochasticGame(I, S, A, mu, P, R, delta)
     return game
+
+
+def create_compiled_routing_game(
+        N: int, M: int, U: int, m: typing.List[numbers.Number], b: typing.List[numbers.Number],
+        lambda_1: float = 0.8, lambda_2: float = 0.2, delta: float = 0.5,
+        common_interest: bool = False, strategy_independent_transitions: bool = False
+):
+    # compile_game(create_routing_game(...)) without evaluating closures per (s, a, s'): the route counts of all
+    # joint actions are computed once and P, R follow by broadcasting, summed in the same order as the closures
+    (I, S) = routing_players_and_states(N, M, U)
+    A = ActionProfileSet([ActionSet(i, [Action(i, value=j) for j in range(M)]) for i in I])
+
+    routes = np.stack(np.unravel_index(np.arange(M ** N), (M, ) * N), axis=-1)  # [|A|, N], in the order of A
+    counts = (routes[:, :, None] == np.arange(M)).sum(axis=1)  # [|A|, M]
+    (reward_routes, route_probabilities) = route_tables(S, counts, U, m, b, lambda_1, lambda_2)
+
+    # R[i, s, a] = b[route] - multiplier * m[route] * count[route] with route = a_i
+    joint_actions = np.arange(M ** N)
+    reward_oneplayer = np.stack([reward_routes[:, joint_actions, routes[:, idx]] for idx in range(N)])  # [N, S, |A|]
+    if common_interest:
+        R = np.zeros(shape=reward_oneplayer.shape[1:])
+        for idx in range(N):
+            R = R + reward_oneplayer[idx]
+        R = np.broadcast_to(R, (N, ) + R.shape).copy()
+    else:
+        R = reward_oneplayer
+
+    # each route's next status depends only on whether at least U players use it; the product runs over routes
+    P_actions = np.ones(shape=route_probabilities.shape[:2])
+    for route in range(M):
+        P_actions = P_actions * route_probabilities[:, :, route]  # [|A|, S']
+
+    if strategy_independent_transitions:
+        transition_matrix = np.cumsum(P_actions, axis=0)[-1]
+        transition_matrix = transition_matrix / np.cumsum(transition_matrix)[-1]
+        P = np.broadcast_to(transition_matrix, (len(S), M ** N, len(S))).copy()
+    else:
+        P = np.broadcast_to(P_actions, (len(S), M ** N, len(S))).copy()
+
+    mu = np.full(shape=(len(S), ), fill_value=1 / len(S))
+    return CompiledGame(I, S, A, mu, P, R, delta)
+
+
+def create_anonymous_routing_game(
+        N: int, M: int, U: int, m: typing.List[numbers.Number], b: typing.List[numbers.Number],
+        lambda_1: float = 0.8, lambda_2: float = 0.2, delta: float = 0.5,
+        common_interest: bool = False, strategy_independent_transitions: bool = False
+):
+    # the routing game of create_routing_game, tabulated over route occupancy vectors instead of joint actions
+    (I, S) = routing_players_and_states(N, M, U)
+    counts = occupancy_vectors(N, M)  # [C, M]
+    (reward_oneplayer, route_probabilities) = route_tables(S, counts, U, m, b, lambda_1, lambda_2)
+
+    if common_interest:
+        R = np.repeat((counts[None, :, :] * reward_oneplayer).sum(axis=-1, keepdims=True), M, axis=-1)
+    else:
+        R = reward_oneplayer
+
+    # each route's next status depends only on whether at least U players use it
+    P_counts = route_probabilities.prod(axis=-1)  # [C, S]
+
+    if strategy_independent_transitions:
+        # sum over all joint actions, i.e. over occupancy vectors weighted by their multinomial coefficients
+        log_weights = math.lgamma(N + 1) - np.vectorize(math.lgamma)(counts + 1.0).sum(axis=-1) - N * math.log(M)
+        transition_matrix = np.exp(log_weights) @ P_counts
+        transition_matrix /= transition_matrix.sum()
+        P = np.broadcast_to(transition_matrix, (len(S), len(counts), len(S))).copy()
+    else:
+        P = np.broadcast_to(P_counts, (len(S), len(counts), len(S))).copy()
+
+    mu = np.full(shape=(len(S), ), fill_value=1 / len(S))
+    return AnonymousGame(I, S, M, mu, P, R, delta)
@@ -0,0 +1,75 @@
+import pathlib
+import tempfile
+import unittest
+
+import numpy as np
+
+from framework.hooks import *
+from framework.kernels import *
+from framework.persistence import *
+from framework.recording import *
+from framework.shared import *
+from independent_decentralized_learning import *
+from routing_game import *
+
+
+def run(game, backend: str, generator: bool):
+    # three lanes with their own step sizes and temperatures, recorded at log-spaced steps and through reducers
+    learner = BatchedIndependentDecentralizedLearner(
+        game, 3, alpha=[lambda n: 1 / n ** 0.5, lambda n: 1 / n, lambda n: 1 / n ** 0.7], tau=[1e-6, 1e-3, 1e-2],
+        generator=np.random.default_rng(4) if generator else None, backend=backend
+    )
+    entropy = PolicyEntropyReducer(EveryNSteps(37))
+    reward = RunningRewardReducer(CustomSteps([5, 400, 999]))
+    history = learner.run(1000, schedule=LogSpacedSteps(20), hooks=[entropy, reward])
+    return [history.steps, history.pi, history.q_tilde, history.s, history.a, entropy.result()[1], reward.result()[1],
+            learner.N, learner.N_tilde, learner.reward_sum]
+
+
+@unittest.skipUnless(JIT_AVAILABLE, "numba is not installed")
+class JitBackendTest(unittest.TestCase):
+    # the jit backend must reproduce the numpy backend bit for bit
+    def assert_backends_agree(self, game, reference_game=None):
+        for generator in (False, True):
+            expected = run(game if reference_game is None else reference_game, "numpy", generator)
+            actual = run(game, "jit", generator)
+            for (x, y) in zip(expected, actual):
+                np.testing.assert_array_equal(x, y)
+
+    def test_compiled_game(self):
+        self.assert_backends_agree(create_compiled_routing_game(3, 3, 2, [1, 2, 3], [5, 6, 8]))
+
+    def test_anonymous_game(self):
+        self.assert_backends_agree(create_anonymous_routing_game(4, 3, 2, [1, 2, 3], [5, 6, 8], common_interest=True))
+
+    def test_run_with_deltas(self):
+        game = create_compiled_routing_game(3, 2, 2, [2, 4], [9, 16], common_interest=True)
+        (expected, actual) = (
+            BatchedIndependentDecentralizedLearner(game, 2, backend=backend).run_with_deltas(300, 50)
+            for backend in ("numpy", "jit")
+        )
+        np.testing.assert_array_equal(expected.pi_rows, actual.pi_rows)
+        np.testing.assert_array_equal(expected.q_tilde_values, actual.q_tilde_values)
+
+    def test_shared_game(self):
+        # read-only views of shared memory blocks
+        for game in (create_compiled_routing_game(3, 2, 2, [2, 4], [9, 16]),
+                     create_anonymous_routing_game(4, 2, 2, [2, 4], [9, 16])):
+            with SharedGame(game) as shared_game:
+                attached = shared_game.attach()
+                self.assertFalse(attached.P.flags.writeable)
+                self.assert_backends_agree(attached, reference_game=game)
+
+    def test_memory_mapped_game(self):
+        for game in (create_compiled_routing_game(3, 2, 2, [2, 4], [9, 16]),
+                     create_anonymous_routing_game(4, 2, 2, [2, 4], [9, 16])):
+            game.transition_sampler()
+            with tempfile.TemporaryDirectory() as directory:
+                loaded = load_compiled_game(save_compiled_game(game, pathlib.Path(directory) / "game"))
+                self.assertFalse(loaded.P.flags.writeable)  # views of the read-only memory maps
+                self.assert_backends_agree(loaded, reference_game=game)
+                del loaded
+
+
+if __name__ == "__main__":
+    unittest.main()
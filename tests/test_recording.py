@@ -0,0 +1,35 @@
+import unittest
+
+import numpy as np
+
+from framework.recording import *
+from independent_decentralized_learning import *
+from routing_game import *
+
+
+class RecordingScheduleTest(unittest.TestCase):
+    # every schedule records steps within 0, ..., K - 1 only, including the last one
+    def test_every_n_steps(self):
+        np.testing.assert_array_equal(EveryNSteps(3).indices(8), [0, 3, 6, 7])
+        np.testing.assert_array_equal(EveryNSteps(3).indices(1), [0])
+        self.assertEqual(len(EveryNSteps(3).indices(0)), 0)
+
+    def test_log_spaced_steps(self):
+        np.testing.assert_array_equal(LogSpacedSteps(5).indices(1), [0])
+        np.testing.assert_array_equal(LogSpacedSteps(5).indices(2), [0, 1])
+        self.assertEqual(len(LogSpacedSteps(5).indices(0)), 0)
+        for K in (3, 10, 1000):
+            steps = LogSpacedSteps(5).indices(K)
+            self.assertEqual((steps[0], steps[-1]), (0, K - 1))
+
+    def test_short_runs(self):
+        # every checkpoint of a short run is written, so each recorded policy is a distribution over actions
+        game = create_compiled_routing_game(2, 2, 2, [2, 4], [9, 16])
+        for K in (1, 2):
+            history = BatchedIndependentDecentralizedLearner(game, 1).run(K, schedule=LogSpacedSteps(5))
+            np.testing.assert_array_equal(history.steps, np.arange(K))
+            np.testing.assert_allclose(history.pi.sum(axis=-1), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -17,4 +17,4 @@ def create_result_folder(N: int, M: int, U: int, lambda_1: float, lambda_2: floa
     return path
 
 
-__all__ = ["create_result_folder"]
+__all__ = ["EXPERIMENTS_DIR", "create_result_folder"]